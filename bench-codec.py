@@ -0,0 +1,332 @@
+import json
+import platform
+import sys
+import timeit
+import types
+from typing import Any, Callable, Iterator, Optional
+
+import ft12
+import iectypes
+
+try:
+    import iec101
+    import scapy
+    from iec101 import FT12Frame, FT12Fixed, FT12Variable, ASDU
+    from scapy.fields import MultipleTypeField, PacketField, PacketListField
+except ImportError:
+    iec101 = None
+
+# Benchmark settings
+REPEAT = 5  # Each run lasts at least 0.2 s (timeit autorange)
+SUITE_REPEAT = 3  # Runs per case of the codec suite (--suite)
+OBJECTS = 8  # Information objects per frame for the types that allow several
+
+ADDR = 1
+IOA = 1001
+VALUE = 12.5
+QDS = 0
+
+
+def fcs_calc2(frame: "FT12Frame") -> "FT12Frame":
+    # Checksum calculation used by Server101 before the ft12 encoder
+    match frame.build()[0]:
+        case 16:
+            payld = frame.build()[1:-2]
+        case 104:
+            payld = frame.build()[4:-2]
+        case _:
+            return frame
+    pl_sum = 0
+    for pl_byte in payld:
+        pl_sum = pl_sum + pl_byte
+    frame.checksum = pl_sum % 256
+    return frame
+
+
+def scapy_fixed() -> bytes:
+    return fcs_calc2(
+        FT12Frame() / FT12Fixed(Control_Flags=0, fcode=9, address=ADDR)
+    ).build()
+
+
+def scapy_variable() -> bytes:
+    frame = FT12Frame() / FT12Variable(
+        LinkUserData=ASDU(
+            VSQ=iec101.VSQ(SQ=0, number=1),
+            type=iectypes.Type.M_ME_NC_1,
+            COT=iectypes.Cot.SPONT,
+            CommonAddress=ADDR,
+            IO=iec101.IO13(
+                IOA=IOA,
+                value=[iec101.ShortFloat(value=VALUE, QDS=QDS)],
+            ),
+        ),
+        Control_Flags=0,
+        length_1=13,
+        length_2=13,
+        fcode=8,
+        address=ADDR,
+    )
+    return fcs_calc2(frame).build()
+
+
+FIXED_TABLE = ft12.fixed_table(ADDR)
+
+
+def ft12_fixed() -> bytes:
+    return FIXED_TABLE[9]
+
+
+def ft12_variable() -> bytes:
+    return ft12.encode_variable(
+        0,
+        8,
+        ADDR,
+        ft12.encode_asdu_head(iectypes.Type.M_ME_NC_1, 0, 1, iectypes.Cot.SPONT, ADDR)
+        + ft12.IO_FORMATS[iectypes.Type.M_ME_NC_1].pack(IOA, VALUE, QDS),
+    )
+
+
+ENCODER = ft12.Encoder()
+
+
+def encoder_variable() -> memoryview:
+    ENCODER.begin(0, 8, ADDR, iectypes.Type.M_ME_NC_1, 0, 1, iectypes.Cot.SPONT, ADDR)
+    ENCODER.pack(ft12.IO_FORMATS[iectypes.Type.M_ME_NC_1], (IOA, VALUE, QDS))
+    return ENCODER.finish()
+
+
+def measure(func: Callable[[], Any], repeat: int = REPEAT) -> float:
+    # Best of repeat runs, microseconds per frame
+    timer = timeit.Timer(func)
+    number = timer.autorange()[0]
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def bench(name: str, func: Callable[[], Any]) -> float:
+    per_frame = measure(func)
+    print(
+        "{:<28} {:10.3f} us/frame   {}".format(name, per_frame, bytes(func()).hex("-"))
+    )
+    return per_frame
+
+
+# Codec suite: parse and build of every type ID supported by the scapy layers
+
+
+def io_field(type: int, sq: int) -> Optional[Any]:
+    # ASDU "IO" field the scapy layer uses for the type and SQ, None if unsupported
+    pkt = types.SimpleNamespace(type=type, VSQ=types.SimpleNamespace(SQ=sq, number=1))
+    ios = next(f for f in ASDU.fields_desc if isinstance(f, MultipleTypeField))
+    for field, cond in ios.flds:
+        if cond(pkt):
+            return field
+    return None
+
+
+def sample_io(type: int) -> bytes:
+    # One information object of the type with the default field values.
+    # Some packet fields default to 0, which builds to nothing: use the
+    # defaults of their classes instead.
+    cls = getattr(iec101, "IO{}".format(type))
+    fields = {
+        f.name: f.cls()
+        for f in cls.fields_desc
+        if isinstance(f, PacketField) and not isinstance(f.default, iec101.Packet)
+    }
+    return bytes(cls(**fields))
+
+
+def variants(type: int) -> Iterator[tuple[int, int, Optional[bytes]]]:
+    # (SQ, number of objects, ASDU) per SQ value, ASDU is None if the layer
+    # doesn't support the SQ value for the type
+    single = io_field(type, 0)
+    sequence = io_field(type, 1)
+    io = sample_io(type)
+    number = OBJECTS if isinstance(single, PacketListField) else 1
+    yield 0, number, ft12.encode_asdu_head(type, 0, number, 3, ADDR) + b"".join(
+        ft12.IOA.pack(IOA + i) + io[ft12.IOA.size :] for i in range(number)
+    )
+    if sequence is single or not isinstance(sequence, PacketField):
+        yield 1, OBJECTS, None  # A list of objects or one object for any SQ
+    else:
+        yield 1, OBJECTS, ft12.encode_asdu_head(type, 1, OBJECTS, 3, ADDR) + io[
+            : ft12.IOA.size
+        ] + io[ft12.IOA.size :] * OBJECTS
+
+
+def scapy_build(frame: "FT12Frame") -> Callable[[], bytes]:
+    # Builds the frame from its fields, not from the cached dissected bytes
+    def build() -> bytes:
+        frame.clear_cache()
+        return frame.build()
+
+    return build
+
+
+def ft12_build(type: int, sq: int, asdu: bytes) -> Optional[Callable[[], Any]]:
+    # Encoder of the objects for the types ft12 encodes, None for the others
+    if type in ft12.IO_FORMATS:
+        io = asdu[ft12.ASDU_HEAD.size :]
+        if sq == 1:
+            (ioa,) = ft12.IOA.unpack_from(io)
+            fmt = ft12.ELEMENT_FORMATS[type]
+            elements = list(fmt.iter_unpack(io[ft12.IOA.size :]))
+            fields = [field for element in elements for field in element]
+
+            def build() -> memoryview:
+                ENCODER.begin(0, 8, ADDR, type, 1, len(elements), 3, ADDR)
+                ENCODER.pack(ft12.IOA, (ioa,))
+                ENCODER.pack(fmt, fields, len(elements))
+                return ENCODER.finish()
+
+        else:
+            fmt = ft12.IO_FORMATS[type]
+            objects = list(fmt.iter_unpack(io))
+            fields = [field for obj in objects for field in obj]
+
+            def build() -> memoryview:
+                ENCODER.begin(0, 8, ADDR, type, 0, len(objects), 3, ADDR)
+                ENCODER.pack(fmt, fields, len(objects))
+                return ENCODER.finish()
+
+        return build
+    if type in ft12.COMMANDS and sq == 0:
+        fmt = ft12.COMMANDS[type][0]
+        fields = fmt.unpack_from(asdu, ft12.ASDU_HEAD.size)
+        return lambda: ft12.encode_variable(
+            0, 8, ADDR, ft12.encode_asdu_head(type, 0, 1, 3, ADDR) + fmt.pack(*fields)
+        )
+    return None
+
+
+def suite_frames(
+    selected: list[int],
+) -> Iterator[tuple[str, Optional[int], int, int, Optional[bytes]]]:
+    # (name, type, SQ, number of objects, frame); frame is None if unsupported
+    if len(selected) == 0:
+        yield "fixed", None, 0, 0, ft12.encode_fixed(5, 11, ADDR)
+        yield "single", None, 0, 0, ft12.SINGLE_ACK
+    for type in sorted(iec101.TYPEID_ASDU):
+        if len(selected) > 0 and type not in selected:
+            continue
+        name = iec101.TYPEID_ASDU[type].split()[0]
+        for sq, number, asdu in variants(type):
+            frame = None if asdu is None else ft12.encode_variable(0, 8, ADDR, asdu)
+            yield name, type, sq, number, frame
+
+
+def suite(selected: list[int], as_json: bool) -> None:
+    # Parse and build throughput of the scapy layers and of ft12 per frame kind
+    results = []
+    if not as_json:
+        print(
+            "{:<10} {:>4} {:>3} {:>4} {:>4}  {:>12} {:>12} {:>12} {:>12}".format(
+                "frame",
+                "type",
+                "SQ",
+                "objs",
+                "len",
+                "scapy parse",
+                "scapy build",
+                "ft12 parse",
+                "ft12 build",
+            )
+        )
+    for name, type, sq, number, raw in suite_frames(selected):
+        case = {"frame": name, "type": type, "sq": sq, "objects": number}
+        if raw is None:
+            results.append(dict(case, supported=False))
+            if not as_json:
+                print(
+                    "{:<10} {:>4} {:>3}  not supported by iec101".format(name, type, sq)
+                )
+            continue
+        parsed = FT12Frame(raw)
+        build = scapy_build(parsed)
+        if type is None:
+            ft12_encode: Optional[Callable[[], Any]] = (
+                (lambda: ft12.encode_fixed(5, 11, ADDR)) if name == "fixed" else None
+            )
+        else:
+            ft12_encode = ft12_build(type, sq, raw[ft12.VARIABLE_HEAD.size : -2])
+        timings = {
+            "scapy_parse": measure(lambda: FT12Frame(raw), SUITE_REPEAT),
+            "scapy_build": measure(build, SUITE_REPEAT),
+            "ft12_parse": measure(lambda: ft12.decode(raw), SUITE_REPEAT),
+            "ft12_build": (
+                measure(ft12_encode, SUITE_REPEAT) if ft12_encode is not None else None
+            ),
+        }
+        results.append(
+            dict(
+                case,
+                supported=True,
+                length=len(raw),
+                frame_hex=raw.hex(),
+                # Build output differs from the parsed frame: the layer loses data
+                scapy_roundtrip=build() == raw,
+                # ft12.decode() leaves the objects of other types undecoded
+                ft12_decodes_io=type is None or type in ft12.COMMANDS,
+                ft12_roundtrip=(
+                    bytes(ft12_encode()) == raw if ft12_encode is not None else None
+                ),
+                us_per_frame=timings,
+            )
+        )
+        if not as_json:
+            print(
+                "{:<10} {:>4} {:>3} {:>4} {:>4}  {}{}".format(
+                    name,
+                    "" if type is None else type,
+                    sq,
+                    number,
+                    len(raw),
+                    " ".join(
+                        "{:>12}".format("-" if us is None else "{:.2f} us".format(us))
+                        for us in timings.values()
+                    ),
+                    "" if build() == raw else "  scapy build differs",
+                )
+            )
+    if as_json:
+        json.dump(
+            {
+                "python": platform.python_version(),
+                "scapy": scapy.VERSION,
+                "objects": OBJECTS,
+                "results": results,
+            },
+            sys.stdout,
+            indent=1,
+        )
+        print()
+
+
+def main() -> None:
+    args = sys.argv[1:]
+    if "--suite" in args or "--json" in args:
+        if iec101 is None:
+            print("The codec suite requires iec101 and scapy", file=sys.stderr)
+            sys.exit(1)
+        suite([int(arg) for arg in args if not arg.startswith("--")], "--json" in args)
+        return
+    cases = []
+    if iec101 is not None:
+        cases += [
+            ("scapy fixed + fcs_calc2", scapy_fixed),
+            ("scapy variable + fcs_calc2", scapy_variable),
+        ]
+    else:
+        print("scapy is not available, skipping the scapy baseline", file=sys.stderr)
+    cases += [
+        ("ft12 fixed_table", ft12_fixed),
+        ("ft12 encode_variable", ft12_variable),
+        ("ft12 Encoder", encoder_variable),
+    ]
+    for name, func in cases:
+        bench(name, func)
+
+
+if __name__ == "__main__":
+    main()
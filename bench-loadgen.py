@@ -0,0 +1,289 @@
+"""
+Master load generator
+
+Opens CONNECTIONS master connections to server-async.py, resets the link
+and polls class 1 and class 2 data as fast as responses arrive, and reports
+frames/s, events/s, interrogation objects/s and response latency per
+scenario. By default every scenario starts server-async.py in its own
+process, with its settings and SERVER_SETTINGS on top, and with the
+scenario's point update rates and grinder. OWN_SERVER = True measures a
+self-contained Server101 server of POINTS points instead: it changes all
+points at once in the burst scenario, but doesn't include the generator,
+logging and other settings of server-async.py. With TARGET set, a running
+server is measured as it is.
+"""
+
+import asyncio
+import functools
+import importlib
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from typing import Optional
+
+import ft12
+import iectypes
+from iec101srv import ChangeLog, Point, PointSet, PointTable, Protocol101, Server101
+
+# Benchmark settings
+TARGET = None  # (host, port) of a running server, None - start one per scenario
+OWN_SERVER = False  # Start the self-contained server instead of server-async.py
+HOST = "127.0.0.1"
+ASDU_ADDR = 1
+CONNECTIONS = 4
+DURATION = 3.0  # Seconds per scenario
+TIMEOUT = 0.05  # Seconds to wait for a response before the request is repeated
+SCENARIOS = ("idle", "burst", "gi", "corrupt")
+BURST_PERIOD = 0.5  # Seconds between changes of every point (burst scenario)
+IDLE_PERIOD = 3600.0  # Seconds between changes of every point (other scenarios)
+STARTUP = 10.0  # Seconds to wait for the server to accept connections
+
+# server-async.py settings changed for the benchmark
+SERVER_SETTINGS = {
+    "PRINTLEVEL": 0,  # Console output would mix with results
+    "MAX_CONNECTIONS": CONNECTIONS + 1,  # And the probe of wait_listening()
+    "MIRRORLOG": False,
+}
+
+# Own server settings
+POINTS = 1000
+
+
+def serve_script(scenario: str, port: int) -> None:
+    # Server process: server-async.py on the given port
+    sa = importlib.import_module("server-async")
+    for name, value in SERVER_SETTINGS.items():
+        setattr(sa, name, value)
+    sa.HOST = HOST
+    sa.PORT = port
+    period = BURST_PERIOD if scenario == "burst" else IDLE_PERIOD
+    sa.DEF_MINUPDATE = sa.DEF_MAXUPDATE = period
+    sa.DEF_RATES = {group: (period, period) for group in sa.DEF_RATES}
+    sa.GRIND = scenario == "corrupt"
+    sys.stdout = open(os.devnull, "w")  # Connection messages would mix with results
+    try:
+        if sa.WORKERS > 1:
+            sa.supervise()
+        else:
+            asyncio.run(sa.main())
+    except KeyboardInterrupt:
+        pass
+
+
+def free_port() -> int:
+    # Port for server-async.py, which can't listen on port 0 and report it
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(host: str, port: int) -> None:
+    deadline = time.monotonic() + STARTUP
+    while True:
+        try:
+            socket.create_connection((host, port), 1.0).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def serve_own(scenario: str, ports: multiprocessing.Queue) -> None:
+    # Server process: Server101 instances on the asyncio.Protocol transport
+    async def run() -> None:
+        table = PointTable()
+        # Contiguous blocks of measurements and single points, like
+        # server-async, so that GI answers carry SQ=1 runs
+        points = [
+            Point(
+                iectypes.Type.M_ME_NC_1 if i < POINTS // 2 else iectypes.Type.M_SP_NA_1,
+                1 + i,
+                0.0,
+                0,
+                time.time(),
+                table=table,
+            )
+            for i in range(POINTS)
+        ]
+        pointset = PointSet(points)
+        changelog = ChangeLog()
+        postproc = None
+        if scenario == "corrupt":
+            sa = importlib.import_module("server-async")
+            sa.GRIND = True
+            postproc = functools.partial(sa.grinder, logging=False)
+
+        def srv_open() -> Optional[Server101]:
+            srv = Server101(
+                ASDU_ADDR, backgrnd=True, postproc=postproc, changelog=changelog
+            )
+            srv.attach(pointset)
+            return srv
+
+        def srv_close(srv: Server101) -> None:
+            srv.del_all_points()
+
+        server = await asyncio.get_running_loop().create_server(
+            lambda: Protocol101(srv_open, srv_close), HOST, 0
+        )
+        ports.put(server.sockets[0].getsockname()[1])
+        value = 0.0
+        while True:
+            await asyncio.sleep(BURST_PERIOD)
+            if scenario == "burst":
+                value = value + 1.0
+                for pt in points:
+                    pt.set(value % 2 if pt.type == 1 else value, 0, time.time())
+
+    sys.stdout = open(os.devnull, "w")  # Connection messages would mix with results
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+class Stats:
+    def __init__(self):
+        self.frames = 0  # Responses received
+        self.events = 0  # Information objects with COT=SPONT
+        self.gi_objects = 0  # Information objects with COT=INROGEN
+        self.timeouts = 0
+        self.latencies: list[float] = []
+
+
+async def master(host: str, port: int, scenario: str, stop: float, stats: Stats):
+    # Polls class 1 data when ACD is set and class 2 data otherwise,
+    # as fast as responses arrive. The gi scenario keeps interrogating.
+    reader, writer = await asyncio.open_connection(host, port)
+    framer = ft12.Framer()
+    fcb = 0
+    gi = ft12.encode_asdu_head(100, 0, 1, iectypes.Cot.ACT, ASDU_ADDR) + bytes(
+        (0, 0, iectypes.Cot.INROGEN)
+    )
+
+    async def request(data: bytes) -> Optional[ft12.Frame]:
+        # Returns the response, None on timeout
+        start = time.perf_counter()
+        writer.write(data)
+        deadline = start + TIMEOUT
+        while True:
+            try:
+                chunk = await asyncio.wait_for(
+                    reader.read(4096), deadline - time.perf_counter()
+                )
+            except asyncio.TimeoutError:
+                stats.timeouts = stats.timeouts + 1
+                return None
+            if len(chunk) == 0:
+                raise ConnectionError("Connection closed by the server")
+            for raw in framer.feed(chunk):
+                frame = ft12.decode(raw)
+                if frame is not None:
+                    stats.latencies.append(time.perf_counter() - start)
+                    stats.frames = stats.frames + 1
+                    return frame
+
+    try:
+        while await request(ft12.encode_fixed(4, 0, ASDU_ADDR)) is None:
+            pass  # Reset of remote link
+        acd = False
+        interrogate = scenario == "gi"
+        while time.perf_counter() < stop:
+            fcb = fcb ^ 1
+            if interrogate:
+                frame = await request(
+                    ft12.encode_variable(5 | (fcb << 1), 3, ASDU_ADDR, gi)
+                )
+                interrogate = frame is None
+            else:
+                frame = await request(
+                    ft12.encode_fixed(5 | (fcb << 1), 10 if acd else 11, ASDU_ADDR)
+                )
+            if frame is None:
+                fcb = fcb ^ 1  # Repeated with the same FCB
+                continue
+            acd = frame.Control_Flags & 2 != 0
+            asdu = frame.LinkUserData
+            if asdu is None:
+                continue
+            match asdu.COT:
+                case iectypes.Cot.SPONT:
+                    stats.events = stats.events + asdu.number
+                case iectypes.Cot.INROGEN:
+                    stats.gi_objects = stats.gi_objects + asdu.number
+                case iectypes.Cot.ACTTERM:
+                    interrogate = scenario == "gi"
+    finally:
+        writer.close()
+
+
+def percentile(values: list[float], p: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+async def run(scenario: str, host: str, port: int) -> Stats:
+    stats = Stats()
+    stop = time.perf_counter() + DURATION
+    await asyncio.gather(
+        *(master(host, port, scenario, stop, stats) for _ in range(CONNECTIONS))
+    )
+    return stats
+
+
+def main() -> None:
+    scenarios = sys.argv[1:] or SCENARIOS
+    print(
+        "{:<8} {:>10} {:>10} {:>10} {:>9} {:>9} {:>9} {:>8}".format(
+            "scenario",
+            "frames/s",
+            "events/s",
+            "GI obj/s",
+            "p50 us",
+            "p99 us",
+            "max us",
+            "timeouts",
+        )
+    )
+    for scenario in scenarios:
+        server = None
+        if TARGET is not None:
+            host, port = TARGET
+        elif OWN_SERVER:
+            ports: multiprocessing.Queue = multiprocessing.Queue()
+            server = multiprocessing.Process(target=serve_own, args=(scenario, ports))
+            server.start()
+            host, port = HOST, ports.get()
+        else:
+            host, port = HOST, free_port()
+            server = multiprocessing.Process(target=serve_script, args=(scenario, port))
+            server.start()
+        try:
+            if server is not None:
+                wait_listening(host, port)
+            stats = asyncio.run(run(scenario, host, port))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+        print(
+            "{:<8} {:>10.0f} {:>10.0f} {:>10.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>8}".format(
+                scenario,
+                stats.frames / DURATION,
+                stats.events / DURATION,
+                stats.gi_objects / DURATION,
+                percentile(stats.latencies, 50) * 1e6,
+                percentile(stats.latencies, 99) * 1e6,
+                max(stats.latencies, default=0.0) * 1e6,
+                stats.timeouts,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
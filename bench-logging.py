@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import time
+from typing import Optional
+
+import ft12
+import iectypes
+from ieclog import LogWriter
+from iec101srv import Point, Protocol101, Server101
+
+# Benchmark settings
+HOST = "127.0.0.1"
+ASDU_ADDR = 1
+REQUESTS = 20000  # Polls per run, sent one by one
+ROUNDS = 3  # Runs of every mode, interleaved so that load changes affect all modes
+POINTS = 100
+LOGLEVEL = 1
+PRINTLEVEL = 0  # Console output is measured too when > 0
+
+
+def make_points() -> list[Point]:
+    return [
+        Point(iectypes.Type.M_ME_NC_1, 1001 + i, float(i), 0, time.time())
+        for i in range(POINTS)
+    ]
+
+
+async def client(port: int) -> list[float]:
+    # Returns response latencies in seconds
+    reader, writer = await asyncio.open_connection(HOST, port)
+    framer = ft12.Framer()
+    writer.write(ft12.encode_fixed(4, 0, ASDU_ADDR))  # Reset of remote link
+    await reader.read(512)
+    polls = [ft12.encode_fixed(5 | (fcb << 1), 11, ASDU_ADDR) for fcb in (0, 1)]
+    latencies = []
+    for i in range(REQUESTS):
+        start = time.perf_counter()
+        writer.write(polls[i % 2])
+        while len(framer.feed(await reader.read(4096))) == 0:
+            pass
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+    return latencies
+
+
+async def run(mode: str) -> list[float]:
+    points = make_points()
+    logfile = tempfile.NamedTemporaryFile("w", suffix=".log", delete=False)
+    logwriter = LogWriter() if mode == "queued" else None
+
+    def srv_open() -> Optional[Server101]:
+        srv = Server101(
+            ASDU_ADDR,
+            backgrnd=True,
+            logfile=logfile,
+            printlvl=0 if mode == "off" else PRINTLEVEL,
+            loglvl=0 if mode == "off" else LOGLEVEL,
+            logwriter=logwriter,
+        )
+        srv.add_points(list(points))
+        return srv
+
+    def srv_close(srv: Server101) -> None:
+        srv.del_all_points()
+
+    server = await asyncio.get_running_loop().create_server(
+        lambda: Protocol101(srv_open, srv_close), HOST, 0
+    )
+    latencies = await client(server.sockets[0].getsockname()[1])
+    server.close()
+    await server.wait_closed()
+    if logwriter is not None:
+        logwriter.close(logfile)
+        logwriter.stop()
+    else:
+        logfile.close()
+    os.remove(logfile.name)
+    return latencies
+
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+async def main() -> None:
+    modes = ("off", "direct", "queued")
+    results: dict[str, list[float]] = {mode: [] for mode in modes}
+    for _ in range(ROUNDS):
+        for mode in modes:
+            results[mode] += await run(mode)
+    print("{:<8} {:>10} {:>10} {:>10}".format("logging", "p50 us", "p99 us", "max us"))
+    for mode, latencies in results.items():
+        print(
+            "{:<8} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                mode,
+                percentile(latencies, 50) * 1e6,
+                percentile(latencies, 99) * 1e6,
+                max(latencies) * 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
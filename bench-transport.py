@@ -0,0 +1,93 @@
+import asyncio
+import time
+from typing import Optional
+
+import ft12
+import iectypes
+from iec101srv import Point, Protocol101, Server101
+
+# Benchmark settings
+HOST = "127.0.0.1"
+ASDU_ADDR = 1
+CLIENTS = 4  # Simultaneous connections
+DEPTH = (1, 8)  # Requests sent in one write (pipelining)
+DURATION = 3.0  # Seconds per run
+POINTS = 100
+
+
+def make_points() -> list[Point]:
+    return [
+        Point(iectypes.Type.M_ME_NC_1, 1001 + i, float(i), 0, time.time())
+        for i in range(POINTS)
+    ]
+
+
+async def client(port: int, depth: int, stop: float) -> int:
+    # Polls class 2 data as fast as responses arrive, returns the number of responses
+    reader, writer = await asyncio.open_connection(HOST, port)
+    framer = ft12.Framer()
+    writer.write(ft12.encode_fixed(4, 0, ASDU_ADDR))  # Reset of remote link
+    await reader.read(512)
+    polls = [ft12.encode_fixed(5 | (fcb << 1), 11, ASDU_ADDR) for fcb in (0, 1)]
+    request = b"".join(polls[i % 2] for i in range(depth))
+    count = 0
+    while time.perf_counter() < stop:
+        writer.write(request)
+        received = 0
+        while received < depth:
+            data = await reader.read(4096)
+            if len(data) == 0:
+                return count
+            received += len(framer.feed(data))
+        count += received
+    writer.close()
+    await writer.wait_closed()
+    return count
+
+
+async def run(transport: str, depth: int) -> float:
+    points = make_points()
+
+    def srv_open() -> Optional[Server101]:
+        srv = Server101(ASDU_ADDR, backgrnd=True)
+        srv.add_points(list(points))
+        return srv
+
+    def srv_close(srv: Server101) -> None:
+        srv.del_all_points()
+
+    async def conn_accept(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        srv = srv_open()
+        await srv.conn_handle_async(reader, writer)
+        srv_close(srv)
+
+    match transport:
+        case "protocol":
+            server = await asyncio.get_running_loop().create_server(
+                lambda: Protocol101(srv_open, srv_close), HOST, 0
+            )
+        case _:
+            server = await asyncio.start_server(conn_accept, HOST, 0)
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    counts = await asyncio.gather(
+        *(client(port, depth, start + DURATION) for _ in range(CLIENTS))
+    )
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return sum(counts) / elapsed
+
+
+async def main() -> None:
+    print("{:<10} {:>6} {:>12}".format("transport", "depth", "frames/s"))
+    for depth in DEPTH:
+        for transport in ("stream", "protocol"):
+            fps = await run(transport, depth)
+            print("{:<10} {:>6} {:>12.0f}".format(transport, depth, fps))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,180 @@
-import iec101
+import array
+import bisect
+import ft12
+import ieclog
 import iectypes
 import random
 import time
 import typing
+import weakref
 import asyncio
+import collections
 import socket
-from iec101 import FT12Frame, FT12Fixed, FT12Variable, FT12Single, ASDU
 from typing import Any, Optional
 
+try:  # scapy is only needed for debug dissection and the scapy decoder
+    import iec101
+    from iec101 import FT12Frame
+except ImportError:
+    iec101 = None
+
+
+class PointTable:
+    # Columnar point database: one typed array per attribute, so a large
+    # number of points takes a few tens of bytes each and bulk operations
+    # work over contiguous arrays. Point objects are views of its rows.
+    # Missing values are stored as NaN (value, time) and -1 (flags).
+
+    def __init__(self):
+        self.type = array.array("B")
+        self.io_address = array.array("I")
+        self.value = array.array("d")
+        self.flags = array.array("h")
+        self.time = array.array("d")
+        self.group = array.array("B")
+        self.dirty = bytearray()  # Set on change, cleared by take_dirty()
+        # Change logs of the servers registered with single rows, by row
+        self.logs: dict[int, dict["ChangeLog", int]] = {}
+        self.free: list[int] = []  # Released rows, reused by add()
+        # Point sets over rows of the table with subscribed servers
+        self.pointsets: list["PointSet"] = []
+
+    def __len__(self) -> int:
+        return len(self.type)
+
+    def __getitem__(self, index: int) -> "Point":
+        return Point.view(self, index)
+
+    def add(
+        self,
+        type: int,
+        io_address: int,
+        value: Any = None,
+        flags: Optional[int] = None,
+        time: Optional[float] = None,
+        group: int = 0,
+    ) -> int:
+        # Appends a row or reuses a released one, returns its index
+        if len(self.free) > 0:
+            index = self.free.pop()
+            self.type[index] = type
+            self.io_address[index] = io_address
+            self.value[index] = NAN if value is None else value
+            self.flags[index] = -1 if flags is None else flags
+            self.time[index] = NAN if time is None else time
+            self.group[index] = group
+            self.dirty[index] = 0
+            return index
+        self.type.append(type)
+        self.io_address.append(io_address)
+        self.value.append(NAN if value is None else value)
+        self.flags.append(-1 if flags is None else flags)
+        self.time.append(NAN if time is None else time)
+        self.group.append(group)
+        self.dirty.append(0)
+        return len(self.type) - 1
+
+    def release(self, index: int) -> None:
+        # Frees the row of a collected point for reuse
+        self.logs.pop(index, None)
+        self.dirty[index] = 0
+        self.free.append(index)
+
+    def logs_of(self, index: int) -> typing.Iterable["ChangeLog"]:
+        # Change logs to record a change of the row in, each log once
+        logs = self.logs.get(index)
+        if len(self.pointsets) == 0:
+            return () if logs is None else logs
+        found = [ps.logs for ps in self.pointsets if ps.contains(self, index)]
+        if logs is not None:
+            found.append(logs)
+        if len(found) <= 1:
+            return found[0] if len(found) == 1 else ()
+        return set().union(*found)
+
+    def views(self) -> list["Point"]:
+        return [Point.view(self, i) for i in range(len(self))]
+
+    def set(
+        self,
+        index: int,
+        value: Any = None,
+        flags: Optional[int] = None,
+        time: Optional[float] = None,
+    ) -> None:
+        if value is not None:
+            self.value[index] = value
+        if flags is not None:
+            self.flags[index] = flags
+        if time is not None:
+            self.time[index] = time
+        self.dirty[index] = 1
+
+    def read(self, index: int) -> tuple[Any, Optional[int], Optional[float]]:
+        # Value, flags and time of a row, None where missing
+        value = self.value[index]
+        flags = self.flags[index]
+        time = self.time[index]
+        return (
+            None if value != value else value,  # NaN means no value
+            None if flags < 0 else flags,
+            None if time != time else time,
+        )
+
+    def snapshot(self) -> dict[str, array.array]:
+        # Copy of the value columns, taken without creating any point views
+        return {
+            "io_address": self.io_address[:],
+            "value": self.value[:],
+            "flags": self.flags[:],
+            "time": self.time[:],
+        }
+
+    def notify(self, indexes: typing.Iterable[int]) -> None:
+        # Records changes of the rows in the change logs, one event per row
+        for index in indexes:
+            for log in self.logs_of(index):
+                log.append(Event(Point.view(self, index), iectypes.Cot.SPONT))
+
+    def record(self, indexes: typing.Iterable[int]) -> None:
+        # Marks rows written directly to the columns as changed
+        indexes = list(indexes)
+        dirty = self.dirty
+        for index in indexes:
+            dirty[index] = 1
+        self.notify(indexes)
+
+    def take_dirty(self) -> list[int]:
+        # Indexes of the rows changed since the previous call
+        changed = [i for i, d in enumerate(self.dirty) if d]
+        self.dirty[:] = bytes(len(self.dirty))
+        return changed
+
+
+NAN = float("nan")
+# Shared table of the points created without one. The row of such a point
+# is released when the point is collected, views of it must not outlive it.
+POINTS = PointTable()
+
+
+def register_log(logs: dict["ChangeLog", int], srv: Any) -> None:
+    # Servers sharing a change log get each change recorded once
+    logs[srv.changelog] = logs.get(srv.changelog, 0) + 1
+
+
+def deregister_log(logs: dict["ChangeLog", int], srv: Any) -> None:
+    count = logs.get(srv.changelog, 0) - 1
+    if count > 0:
+        logs[srv.changelog] = count
+    else:
+        logs.pop(srv.changelog, None)
+
 
 class Point:
+    # View of a PointTable row. Changes of a point are recorded in the
+    # change logs of the servers registered with it.
+
+    __slots__ = ["table", "index", "__weakref__"]
 
     def __init__(
         self,
@@ -19,25 +184,67 @@ class Point:
         flags: Optional[int] = None,
         time: Optional[float] = None,
         server: Optional[Any] = None,
+        group: int = 0,  # Interrogation group 1..16, 0 - station only
+        table: Optional[PointTable] = None,
     ):
-        self.server = []
+        self.table = table if table is not None else POINTS
+        self.index = self.table.add(type, io_address, value, flags, time, group)
+        if table is None:
+            weakref.finalize(self, POINTS.release, self.index)
         if server is not None:
-            self.server.append(server)
-        self.type = type
-        self.io_address = io_address
-        self.value = value
-        self.flags = flags
-        self.time = time
-
-    def srv_register(self, srv: object) -> None:
-        self.server.append(srv)
-
-    def srv_deregister(self, srv: object) -> None:
-        try:
-            while True:
-                self.server.remove(srv)
-        except ValueError:
-            return
+            self.srv_register(server)
+
+    @classmethod
+    def view(cls, table: PointTable, index: int) -> "Point":
+        pt = cls.__new__(cls)
+        pt.table = table
+        pt.index = index
+        return pt
+
+    @property
+    def type(self) -> int:
+        return self.table.type[self.index]
+
+    @property
+    def io_address(self) -> int:
+        return self.table.io_address[self.index]
+
+    @property
+    def group(self) -> int:
+        return self.table.group[self.index]
+
+    @property
+    def value(self) -> Any:
+        value = self.table.value[self.index]
+        return None if value != value else value  # NaN means no value
+
+    @property
+    def flags(self) -> Optional[int]:
+        flags = self.table.flags[self.index]
+        return None if flags < 0 else flags
+
+    @property
+    def time(self) -> Optional[float]:
+        time = self.table.time[self.index]
+        return None if time != time else time
+
+    def read(self) -> tuple[Any, Optional[int], Optional[float]]:
+        # Consistent value, flags and time, even if the table is shared
+        return self.table.read(self.index)
+
+    @property
+    def logs(self) -> typing.Iterable["ChangeLog"]:
+        return self.table.logs_of(self.index)
+
+    def srv_register(self, srv: Any) -> None:
+        register_log(self.table.logs.setdefault(self.index, {}), srv)
+
+    def srv_deregister(self, srv: Any) -> None:
+        logs = self.table.logs.get(self.index)
+        if logs is not None:
+            deregister_log(logs, srv)
+            if len(logs) == 0:
+                del self.table.logs[self.index]
 
     def set(
         self,
@@ -45,15 +252,11 @@ class Point:
         flags: Optional[int] = None,
         time: Optional[float] = None,
     ) -> None:
-        if value is not None:
-            self.value = value
-        if flags is not None:
-            self.flags = flags
-        if time is not None:
-            self.time = time
+        table = self.table
+        table.set(self.index, value, flags, time)
 
-        for s in self.server:
-            s.add_event(self, iectypes.Cot.SPONT)
+        for log in table.logs_of(self.index):
+            log.append(Event(self, iectypes.Cot.SPONT))
 
 
 class Event:
@@ -79,20 +282,23 @@ class Event:
         self.time = None
 
         # !!! This needs to be deleted AFTER refactoring
+        if value is None or flags is None or time is None:
+            pt_value, pt_flags, pt_time = self.point.read()
+
         if value is not None:
             self.value = value
         else:
-            self.value = self.point.value
+            self.value = pt_value
 
         if flags is not None:
             self.flags = flags
         else:
-            self.flags = self.point.flags
+            self.flags = pt_flags
 
         if time is not None:
             self.time = time
         else:
-            self.time = self.point.time
+            self.time = pt_time
 
     # !!! This needs to be deleted AFTER refactoring
     def exists(self) -> bool:
@@ -105,6 +311,155 @@ class Event:
         )
 
 
+class Overflow:
+    # Event queue overflow policies
+    DROP_OLDEST = 0
+    DROP_NEWEST = 1
+    INROGEN = 2  # Drop newest and force interrogation
+
+
+class ChangeLog:
+    # Ring buffer of point changes shared by servers.
+    # Every change is recorded once, each server reads the log
+    # through its own EventQueue cursor. A shared log is bound to one
+    # PointSet, so its readers get no records of points they don't serve.
+
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        self.records: list[Optional[Event]] = [None] * capacity
+        self.head = 0  # Sequence number of the next record
+        self.last_seq: dict[int, int] = {}  # Latest record for every IOA
+        self.pointset: Optional["PointSet"] = None  # Set of the shared log
+
+    def bind(self, pointset: "PointSet") -> None:
+        if self.pointset is None:
+            self.pointset = pointset
+        elif self.pointset is not pointset:
+            raise ValueError("Shared change log is bound to another point set")
+
+    def append(self, ev: Event) -> None:
+        self.records[self.head % self.capacity] = ev
+        self.last_seq[ev.point.io_address] = self.head
+        self.head = self.head + 1
+
+    def get(self, seq: int) -> Event:
+        return self.records[seq % self.capacity]
+
+    def tail(self) -> int:
+        # Sequence number of the oldest record still in the log
+        return max(0, self.head - self.capacity)
+
+
+class EventQueue:
+    # Class 1 events of one server: a cursor over the shared ChangeLog.
+    # Unread records beyond capacity are handled by the overflow policy.
+    # With coalescing, the first unsent record of an IOA is sent with the
+    # latest value and later records of that IOA are skipped, except for
+    # keep_types.
+
+    def __init__(
+        self,
+        log: ChangeLog,
+        capacity: int = 10000,
+        overflow: int = Overflow.DROP_OLDEST,
+        coalesce: bool = False,
+        on_overflow: Optional[typing.Callable[[], None]] = None,
+    ):
+        self.log = log
+        self.cursor = log.head  # Sequence number of the next record to read
+        self.capacity = capacity
+        self.overflow = overflow
+        self.coalesce = coalesce
+        self.on_overflow = on_overflow  # Called on overflow with INROGEN policy
+        self.keep_types = {
+            iectypes.Type.M_SP_NA_1,
+            iectypes.Type.M_SP_TA_1,
+            iectypes.Type.M_DP_NA_1,
+            iectypes.Type.M_DP_TA_1,
+            iectypes.Type.M_SP_TB_1,
+            iectypes.Type.M_DP_TB_1,
+        }  # Types where every transition must be reported
+        self.limit: Optional[int] = None  # Records from limit to skip_to are dropped
+        self.skip_to = 0
+        self.sent: dict[int, int] = {}  # Latest record sent for IOA (coalescing)
+        self.overflowed = False  # Events were dropped since the queue was empty
+        self.dropped = 0  # Total number of dropped events
+        self.coalesced = 0  # Total number of events merged into unsent ones
+
+    def __len__(self) -> int:
+        self._advance()
+        if self.limit is not None:
+            return self.limit - self.cursor
+        return self.log.head - self.cursor
+
+    def __getitem__(self, index: int) -> Event:
+        # Only the head of the queue is available
+        if index != 0:
+            raise IndexError("EventQueue index out of range")
+        return self.log.get(self._current())
+
+    def popleft(self) -> Event:
+        seq = self._current()
+        ev = self.log.get(seq)
+        if seq != self.cursor:  # Newer record is sent in place of this one
+            self.sent[ev.point.io_address] = seq
+        self.cursor = self.cursor + 1
+        return ev
+
+    def _current(self) -> int:
+        # Sequence number of the record to send next
+        self._advance()
+        if self.cursor >= self.log.head:
+            raise IndexError("pop from an empty EventQueue")
+        ev = self.log.get(self.cursor)
+        if self.coalesce and ev.point.type not in self.keep_types:
+            latest = self.log.last_seq[ev.point.io_address]
+            if (
+                latest > self.cursor
+                and (self.limit is None or latest < self.limit)
+                and self.log.get(latest).cot == ev.cot
+            ):
+                return latest
+        return self.cursor
+
+    def _drop(self, seq: int) -> None:
+        # Moves the cursor forward to seq, skipped records are lost
+        if seq > self.cursor:
+            self.dropped = self.dropped + seq - self.cursor
+            self.overflowed = True
+            self.cursor = seq
+
+    def _advance(self) -> None:
+        # Applies overflow policy and skips records that won't be sent
+        log = self.log
+        self._drop(log.tail())  # Unread records were overwritten
+        if self.limit is None and log.head - self.cursor > self.capacity:
+            if self.overflow == Overflow.DROP_OLDEST:
+                self._drop(log.head - self.capacity)
+            else:
+                self.limit = self.cursor + self.capacity
+                self.skip_to = log.head
+                self.overflowed = True
+                if self.overflow == Overflow.INROGEN and self.on_overflow is not None:
+                    self.on_overflow()
+        while self.cursor < log.head:
+            if self.limit is not None and self.cursor >= self.limit:
+                self._drop(self.skip_to)
+                self.limit = None
+                continue
+            ev = log.get(self.cursor)
+            sent = self.sent.get(ev.point.io_address)
+            if sent is None or sent < self.cursor:
+                break
+            # Already sent with a newer value
+            if sent == self.cursor:
+                del self.sent[ev.point.io_address]
+            self.cursor = self.cursor + 1
+            self.coalesced = self.coalesced + 1
+        if self.cursor >= log.head:
+            self.overflowed = False
+
+
 class Eventpack:
     def __init__(self):
         self.evts = []
@@ -116,15 +471,25 @@ class Eventpack:
 
 class Eventpack_evlist(Eventpack):
 
-    def __init__(self, evlist: list[Event]):
+    def __init__(self, evlist: EventQueue):
         super().__init__()
         if len(evlist) > 0:
-            self.ev = evlist.pop(0)
+            self.ev = evlist.popleft()
             if self.ev.exists():
                 self.evts.append(self.ev)
                 self.cot = self.ev.cot
                 self.type = self.ev.point.type
                 self.time = self.ev.time
+                # Following events of the same type and COT go to the same ASDU
+                limit = ft12.io_capacity(self.type)
+                while (
+                    len(self.evts) < limit
+                    and len(evlist) > 0
+                    and evlist[0].cot == self.cot
+                    and evlist[0].point.type == self.type
+                    and evlist[0].exists()
+                ):
+                    self.evts.append(evlist.popleft())
             self.sq = 0
 
 
@@ -142,6 +507,155 @@ class Eventpack_points(Eventpack):
             self.sq = 0
 
 
+class Confirmation:
+    # Command confirmation or termination, sent as class 1 data
+
+    def __init__(
+        self,
+        type: int,
+        cot: int,
+        ioa: int = 0,
+        qualifier: Optional[int] = None,
+        negative: bool = False,
+    ):
+        self.type = type
+        self.cot = cot
+        self.ioa = ioa
+        self.qualifier = qualifier
+        self.negative = negative
+
+
+class Interrogation:
+    # Interrogation in progress: a cursor over the runs index,
+    # so (re)starting it doesn't depend on the number of points.
+    # qoi is set when ACTTERM is to be sent at the end.
+
+    def __init__(
+        self,
+        runs: Optional[list[list[Point]]] = None,
+        cot: int = 0,
+        qoi: Optional[int] = None,
+    ):
+        self.runs: list[list[Point]] = runs if runs is not None else []
+        self.cot = cot
+        self.qoi = qoi
+        self.run = 0  # Index of the current run
+        self.offset = 0  # Index of the next point in the current run
+
+    def __len__(self) -> int:
+        # Number of runs left
+        return len(self.runs) - self.run
+
+
+class Eventpack_runs(Eventpack):
+    # Takes points from the current run of contiguous IOAs,
+    # several points are packed into an SQ=1 sequence
+
+    def __init__(self, inrg: Interrogation):
+        super().__init__()
+        # Points without data are skipped
+        while len(self.evts) == 0 and len(inrg) > 0:
+            run = inrg.runs[inrg.run]
+            limit = ft12.io_capacity(run[0].type, sq=1)
+            while inrg.offset < len(run) and len(self.evts) < limit:
+                ev = Event(run[inrg.offset], inrg.cot)
+                if ev.exists():
+                    self.evts.append(ev)
+                elif len(self.evts) > 0:  # End of the sequence
+                    break
+                inrg.offset = inrg.offset + 1
+            if inrg.offset >= len(run):
+                inrg.run = inrg.run + 1
+                inrg.offset = 0
+            self.cot = inrg.cot
+            self.type = run[0].type
+            self.time = time.time()
+            self.sq = 1 if len(self.evts) > 1 else 0
+
+
+def build_runs(points: list[Point]) -> dict[int, list[list[Point]]]:
+    # Points of the station (0) and of every group (1..16)
+    # grouped into runs of contiguous IOAs of the same type
+    runs: dict[int, list[list[Point]]] = {g: [] for g in range(17)}
+    for pt in sorted(points, key=lambda p: (p.type, p.io_address)):
+        # Every point belongs to the station group, some to one more group
+        groups = (0, pt.group) if 1 <= pt.group <= 16 else (0,)
+        for g in groups:
+            group_runs = runs[g]
+            if (
+                len(group_runs) > 0
+                and group_runs[-1][-1].type == pt.type
+                and group_runs[-1][-1].io_address + 1 == pt.io_address
+            ):
+                group_runs[-1].append(pt)
+            else:
+                group_runs.append([pt])
+    return runs
+
+
+class IoaIndex:
+    # Read-only IOA index of a point list: IOAs and list positions in two
+    # sorted arrays, 8 bytes per point instead of a dict entry
+
+    def __init__(self, points: list[Point]):
+        self.points = points
+        order = sorted(range(len(points)), key=lambda i: points[i].io_address)
+        self.ioas = array.array("I", [points[i].io_address for i in order])
+        self.positions = array.array("I", order)
+
+    def __len__(self) -> int:
+        return len(self.ioas)
+
+    def get(self, ioa: int, default: Optional[Point] = None) -> Optional[Point]:
+        # The last of points with the same IOA, as in a dict
+        i = bisect.bisect_right(self.ioas, ioa) - 1
+        if i >= 0 and self.ioas[i] == ioa:
+            return self.points[self.positions[i]]
+        return default
+
+
+class PointSet:
+    # Point set shared by servers. Its indexes are built once, and servers
+    # attach to it and detach from it without touching individual points:
+    # change logs are registered with the point set, and the tables record
+    # changes of its rows in them.
+
+    def __init__(self, points: list[Point]):
+        self.points = points  # Must not be changed while servers are attached
+        self.ioa_index = IoaIndex(points)
+        # Rows of the point set in every table, 1 byte per table row
+        self.rows: dict[PointTable, bytearray] = {}
+        for pt in points:
+            rows = self.rows.get(pt.table)
+            if rows is None:
+                rows = self.rows[pt.table] = bytearray(len(pt.table))
+            rows[pt.index] = 1
+        self.logs: dict[ChangeLog, int] = {}  # Change logs of attached servers
+        self.runs: Optional[dict[int, list[list[Point]]]] = None
+
+    def contains(self, table: PointTable, index: int) -> bool:
+        rows = self.rows.get(table)
+        return rows is not None and index < len(rows) and rows[index] == 1
+
+    def get_runs(self) -> dict[int, list[list[Point]]]:
+        if self.runs is None:
+            self.runs = build_runs(self.points)
+        return self.runs
+
+    def subscribe(self, srv: Any) -> None:
+        if len(self.logs) == 0:
+            for table in self.rows:
+                table.pointsets.append(self)
+        register_log(self.logs, srv)
+
+    def unsubscribe(self, srv: Any) -> None:
+        deregister_log(self.logs, srv)
+        if len(self.logs) == 0:
+            for table in self.rows:
+                if self in table.pointsets:
+                    table.pointsets.remove(self)
+
+
 class Server101:
 
     def __init__(
@@ -152,16 +666,40 @@ class Server101:
         logfile: Optional[typing.TextIO] = None,
         printlvl: int = 0,
         loglvl: int = 0,
+        scapy: bool = False,
+        evqueue_size: int = 10000,
+        evqueue_overflow: int = Overflow.DROP_OLDEST,
+        evqueue_coalesce: bool = False,
+        changelog: Optional[ChangeLog] = None,
+        logwriter: Optional[ieclog.LogWriter] = None,
+        capture: Optional[ieclog.CaptureWriter] = None,
     ):
+        if scapy and iec101 is None:
+            raise ImportError("scapy decoder requires iec101 and scapy")
         self.asdu_addr = asdu_addr
         self.backgrnd = backgrnd
         self.postprocessing = postproc
         self.points: list[Point] = []  # List of points available for this server
+        # Points by information object address
+        self.ioa_index: dict[int, Point] | IoaIndex = {}
+        self.pointset: Optional[PointSet] = None  # Shared point set, if attached
         self.last_point_get = 0
-        self.events: list[Event] = []  # Events list for class 1 data transmission
-        self.inrglist: list[Point] = (
-            []
-        )  # Points list for inrogen data prep and transmission
+        # Change log shared with other servers, or a private one
+        self.changelog = changelog if changelog is not None else ChangeLog()
+        self.shared_log = changelog is not None  # Only a PointSet can be served
+        self.events = EventQueue(
+            self.changelog,
+            evqueue_size,
+            evqueue_overflow,
+            evqueue_coalesce,
+            self.events_lost,
+        )  # Events queue for class 1 data transmission
+        # Contiguous IOA runs index for station (0) and group (1..16) interrogation
+        self.runs: Optional[dict[int, list[list[Point]]]] = None
+        self.inrg = Interrogation()  # Inrogen data transmission state
+        self.confirmations: collections.deque[Confirmation | Eventpack] = (
+            collections.deque()
+        )  # Command confirmations and read replies for class 1 data transmission
         self.state = -1  # -1: channel is not reset; 0: channel is reset
         self.acd = False
         self.dfc = False
@@ -169,6 +707,12 @@ class Server101:
         self.logfile = logfile
         self.printlvl = printlvl
         self.loglvl = loglvl
+        self.logwriter = logwriter  # Background log writer, None - write directly
+        self.capture = capture  # Binary frame capture
+        self.scapy = scapy  # Decode requests with scapy instead of ft12
+        self.fixed_frames = ft12.fixed_table(asdu_addr)  # Prebuilt link replies
+        self.encoder = ft12.Encoder()  # Output buffer for variable frames
+        self.framer = ft12.Framer()  # Splits received data into frames
 
     def channel_reset(self) -> None:
         self.state = 0
@@ -176,52 +720,149 @@ class Server101:
 
     def channel_unreset(self) -> None:
         self.state = -1
+        self.framer.reset()
+
+    def attach(self, pointset: PointSet) -> None:
+        # Serves the shared point set instead of own points, in constant time
+        if self.shared_log:
+            self.changelog.bind(pointset)
+        self.del_all_points()
+        pointset.subscribe(self)
+        self.pointset = pointset
+        self.points = pointset.points
+        self.ioa_index = pointset.ioa_index
+        self.runs = pointset.get_runs()
+        self.last_point_get = 0
+
+    def detach(self) -> None:
+        if self.pointset is None:
+            return
+        self.pointset.unsubscribe(self)
+        self.pointset = None
+        self.points = []
+        self.ioa_index = {}
+        self.runs = None
+
+    def own_points(self) -> None:
+        # Copy of the shared point set before it is changed by this server
+        if self.pointset is not None:
+            pts = list(self.points)
+            self.detach()
+            self.add_points(pts)
+
+    def check_own_points(self) -> None:
+        # Own points would be recorded in the log read by other servers
+        if self.shared_log:
+            raise ValueError("Server with a shared change log serves a PointSet only")
 
     def add_point(self, pt: Point) -> None:
+        self.check_own_points()
+        self.own_points()
         self.points.append(pt)
+        self.ioa_index[pt.io_address] = pt
+        self.runs = None
         pt.srv_register(self)
 
     def add_points(self, pts: list[Point]) -> None:
+        self.check_own_points()
+        self.detach()
         self.points = pts
+        self.ioa_index = {pt.io_address: pt for pt in pts}
+        self.runs = None
         for pt in pts:
             pt.srv_register(self)
 
     def del_all_points(self) -> None:
+        if self.pointset is not None:
+            self.detach()
+            return
         for p in self.points:
             p.srv_deregister(self)
         self.points.clear()
+        self.ioa_index.clear()
+        self.runs = None
+
+    def get_runs(self, group: int = 0) -> list[list[Point]]:
+        if self.runs is None:
+            self.runs = build_runs(self.points)
+        return self.runs[group]
+
+    def events_lost(self) -> None:
+        # Lost events are recovered by interrogation
+        if len(self.inrg) == 0:
+            self.start_inrogen()
+
+    def start_inrogen(self, group: int = 0, qoi: Optional[int] = None) -> None:
+        # (Re)starts interrogation of the station (group 0) or of a group
+        self.inrg = Interrogation(
+            self.get_runs(group), iectypes.Cot.INROGEN + group, qoi
+        )
+        if qoi is not None and len(self.inrg) == 0:  # Nothing to send
+            self.inrogen_end()
 
-    def add_event(self, *args, **kwargs) -> None:
-        # Adds event to Event list when point has changed
-        self.events.append(Event(*args, **kwargs))
-
-    def start_inrogen(self) -> None:
-        for point in self.points:
-            if point not in self.inrglist:
-                self.inrglist.append(point)
-
-    def fcs_calc2(self, frame: FT12Frame) -> FT12Frame:
-        # Frame checksum calculation
-        # Fixed and Variable frame types
-        match frame.build()[0]:
-            case 16:
-                payld = frame.build()[1:-2]
-            case 104:
-                payld = frame.build()[4:-2]
+    def inrogen_end(self) -> None:
+        self.confirmations.append(
+            Confirmation(
+                iectypes.Type.C_IC_NA_1, iectypes.Cot.ACTTERM, 0, self.inrg.qoi
+            )
+        )
+        self.inrg.qoi = None
+
+    def inrogen_cmd(self, asdu: ft12.ASDU) -> None:
+        # Interrogation command processing, QOI 20 - station, 21..36 - groups
+        ioa = getattr(asdu.IO, "IOA", 0)
+        qoi = getattr(asdu.IO, "QOI", None)  # None if the IO is too short
+        match asdu.COT:
+            case iectypes.Cot.ACT:
+                if (
+                    qoi is not None
+                    and iectypes.Cot.INROGEN <= qoi <= iectypes.Cot.INRO16
+                ):
+                    self.confirmations.append(
+                        Confirmation(asdu.type, iectypes.Cot.ACTCON, ioa, qoi)
+                    )
+                    self.start_inrogen(qoi - iectypes.Cot.INROGEN, qoi)
+                else:
+                    self.confirmations.append(
+                        Confirmation(asdu.type, iectypes.Cot.ACTCON, ioa, qoi, True)
+                    )
+            case iectypes.Cot.DEACT:
+                self.confirmations.append(
+                    Confirmation(
+                        asdu.type,
+                        iectypes.Cot.DEACTCON,
+                        ioa,
+                        qoi,
+                        len(self.inrg) == 0,  # Negative if there was no interrogation
+                    )
+                )
+                self.inrg = Interrogation()
             case _:
-                return frame
-        pl_sum = 0
-        for pl_byte in payld:
-            pl_sum = pl_sum + pl_byte
-        frame.checksum = pl_sum % 256
-        return frame
+                self.confirmations.append(
+                    Confirmation(asdu.type, iectypes.Cot.UNCCAUSE, ioa, qoi, True)
+                )
+
+    def read_cmd(self, asdu: ft12.ASDU) -> None:
+        # Read command processing: the point is sent with COT=REQ as class 1 data
+        ioa = getattr(asdu.IO, "IOA", 0)
+        pt = self.ioa_index.get(ioa)
+        if asdu.COT != iectypes.Cot.REQ:
+            self.confirmations.append(
+                Confirmation(asdu.type, iectypes.Cot.UNCCAUSE, ioa, negative=True)
+            )
+        elif pt is None or not Event(pt, iectypes.Cot.REQ).exists():
+            self.confirmations.append(
+                Confirmation(asdu.type, iectypes.Cot.UNCIOA, ioa, negative=True)
+            )
+        else:
+            self.confirmations.append(Eventpack_points([pt], iectypes.Cot.REQ))
 
     def get_ctrl(self) -> int:
         # Generating Control flags using current server state
         control = 0
         if self.dfc:
             control = control + 1
-        if len(self.events) > 0:
+        if len(self.confirmations) > 0 or len(self.events) > 0:
             control = control + 2  # acd - 1class data query
         return control
 
@@ -242,122 +883,125 @@ class Server101:
             pass
         return pointlist
 
-    def gen_resp(self, evpack: Eventpack) -> FT12Frame:
-        # Что-то с генерацией значений ShortFloat и значений и флагов SIQ в iec101
-
-        if len(evpack.evts) == 0:
-            return FT12Frame() / FT12Fixed(
-                Control_Flags=self.get_ctrl(), fcode=9, address=self.asdu_addr
-            )
-        ev = evpack.evts[0]
-        match evpack.type:
-            case iectypes.Type.M_SP_NA_1:
-                resp = FT12Frame() / FT12Variable(
-                    LinkUserData=ASDU(
-                        VSQ=iec101.VSQ(SQ=0, number=1),
-                        type=iectypes.Type.M_SP_NA_1,
-                        COT=ev.cot,
-                        CommonAddress=self.asdu_addr,
-                        IO=iec101.IO1(
-                            IOA=ev.point.io_address,
-                            SIQ=self.get_siq(ev.value, ev.flags),
-                        ),
-                    ),
-                    Control_Flags=self.get_ctrl(),
-                    length_1=9,
-                    length_2=9,
-                    fcode=8,
-                    address=1,
-                )
-            case iectypes.Type.M_ME_NC_1:
-                resp = FT12Frame() / FT12Variable(
-                    LinkUserData=ASDU(
-                        VSQ=iec101.VSQ(SQ=0, number=1),
-                        type=iectypes.Type.M_ME_NC_1,
-                        COT=ev.cot,
-                        CommonAddress=self.asdu_addr,
-                        IO=iec101.IO13(
-                            IOA=ev.point.io_address,
-                            value=[
-                                iec101.ShortFloat(value=ev.value, QDS=ev.flags),
-                            ],
-                        ),
-                    ),
-                    Control_Flags=self.get_ctrl(),
-                    length_1=13,
-                    length_2=13,
-                    fcode=8,
-                    address=1,
-                )
-            case _:
-                ### Can't send this type of event, sending 'Data unavailable'
-                resp = FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=9, address=self.asdu_addr
-                )
-
-        return resp
-
-    def userdata_proc(self, frame: FT12Frame) -> FT12Frame:
-        match frame.LinkUserData.type:
+    def fixed_resp(self, fcode: int) -> bytes:
+        return self.fixed_frames[(self.get_ctrl() << 4) | fcode]
+
+    def gen_resp(self, evpack: Eventpack) -> bytes | memoryview:
+        if len(evpack.evts) == 0 or evpack.type not in ft12.IO_FORMATS:
+            ### No data or can't send this type of event, sending 'Data unavailable'
+            return self.fixed_resp(9)
+        enc = self.encoder
+        enc.begin(
+            self.get_ctrl(),
+            8,
+            self.asdu_addr,
+            evpack.type,
+            evpack.sq,
+            len(evpack.evts),
+            evpack.cot,
+            self.asdu_addr,
+        )
+        # Fields of all objects are packed at once
+        fields: list[Any] = []
+        for ev in evpack.evts:
+            if evpack.sq == 0:
+                fields.append(ev.point.io_address)
+            match evpack.type:
+                case iectypes.Type.M_SP_NA_1:
+                    fields.append(self.get_siq(ev.value, ev.flags))
+                case iectypes.Type.M_ME_NC_1:
+                    fields.append(ev.value)
+                    fields.append(ev.flags)
+        if evpack.sq == 1:  # Only the first IOA of a sequence is transmitted
+            enc.pack(ft12.IOA, (evpack.evts[0].point.io_address,))
+            enc.pack(ft12.ELEMENT_FORMATS[evpack.type], fields, len(evpack.evts))
+        else:
+            enc.pack(ft12.IO_FORMATS[evpack.type], fields, len(evpack.evts))
+        return enc.finish()
+
+    def gen_conf(self, conf: Confirmation) -> memoryview:
+        enc = self.encoder
+        enc.begin(
+            self.get_ctrl(),
+            8,
+            self.asdu_addr,
+            conf.type,
+            0,
+            1,
+            conf.cot | ft12.COT_NEGATIVE if conf.negative else conf.cot,
+            self.asdu_addr,
+        )
+        fmt, qualifier = ft12.COMMANDS[conf.type]
+        if qualifier is not None:
+            enc.pack(fmt, (conf.ioa, conf.qualifier or 0))
+        else:
+            enc.pack(fmt, (conf.ioa,))
+        return enc.finish()
+
+    def inrogen_data(self) -> bytes | memoryview:
+        evpack = Eventpack_runs(self.inrg)
+        if len(self.inrg) == 0 and self.inrg.qoi is not None:
+            self.inrogen_end()  # ACTTERM is announced with this response
+        return self.gen_resp(evpack)
+
+    def userdata_proc(self, frame: ft12.Frame) -> bytes | memoryview:
+        # Scapy fixed frames have no LinkUserData field at all
+        asdu = getattr(frame, "LinkUserData", None)
+        if asdu is None:  # User data function sent in a fixed frame
+            return self.fixed_resp(15)
+        match asdu.type:
             case 100:
-                self.start_inrogen()
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=0, address=self.asdu_addr
-                )
+                self.inrogen_cmd(asdu)
+                return self.fixed_resp(0)
+            case 102:
+                self.read_cmd(asdu)
+                return self.fixed_resp(0)
             case _:
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=15, address=self.asdu_addr
-                )
+                return self.fixed_resp(15)
 
     ##IEC101 State-machine
-    def _when_not_reset(self, frame: FT12Frame) -> Optional[FT12Frame]:
+    def _when_not_reset(self, frame: ft12.Frame) -> Optional[bytes | memoryview]:
         match frame.fcode:
 
             case 0:
                 self.channel_reset()
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=0, address=self.asdu_addr
-                )
+                return self.fixed_resp(0)
 
             case 9:
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=11, address=self.asdu_addr
-                )
+                return self.fixed_resp(11)
 
             case _:
                 return None
 
-    def _when_is_reset(self, frame: FT12Frame) -> FT12Frame:
+    def _when_is_reset(self, frame: ft12.Frame) -> bytes | memoryview:
         match frame.fcode:
 
             case 0:
                 self.channel_reset()
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=0, address=self.asdu_addr
-                )
+                return self.fixed_resp(0)
 
             case 3:
                 return self.userdata_proc(frame)
 
             case 9:
-                return FT12Frame() / FT12Fixed(
-                    Control_Flags=self.get_ctrl(), fcode=11, address=self.asdu_addr
-                )
+                return self.fixed_resp(11)
 
             case 10:
-                if len(self.events) > 0:
+                if len(self.confirmations) > 0:
+                    reply = self.confirmations.popleft()
+                    if isinstance(reply, Confirmation):
+                        return self.gen_conf(reply)
+                    return self.gen_resp(reply)  # Read command reply
+
+                elif len(self.events) > 0:
                     return self.gen_resp(Eventpack_evlist(self.events))
 
                 else:
-                    return FT12Frame() / FT12Fixed(
-                        Control_Flags=self.get_ctrl(), fcode=9, address=self.asdu_addr
-                    )
+                    return self.fixed_resp(9)
 
             case 11:  # Class 2 query
-                if len(self.inrglist) > 0:  # interrogation data
-                    return self.gen_resp(
-                        Eventpack_points(self.inrglist, iectypes.Cot.INROGEN)
-                    )
+                if len(self.inrg) > 0:  # interrogation data
+                    return self.inrogen_data()
 
                 else:  # No inrogen data
                     if self.backgrnd:
@@ -368,62 +1012,70 @@ class Server101:
                             )
                         )
                     else:
-                        return FT12Frame() / FT12Fixed(
-                            Control_Flags=self.get_ctrl(),
-                            fcode=9,
-                            address=self.asdu_addr,
-                        )  # Send No data
+                        return self.fixed_resp(9)  # Send No data
 
             case _:
-                return FT12Frame() / FT12Single()
+                return ft12.SINGLE_ACK
 
     ##End of IEC101 State-machine
 
     def logging(
         self,
         comment: str = "",
-        data: Optional[bytes] = None,
+        data: Optional[bytes | memoryview] = None,
         loglevel: int = 1,
         printlevel: int = 1,
+        direction: int = ieclog.RECEIVED,
     ) -> None:
 
+        if self.capture is not None and data is not None:
+            self.capture.write(direction, data)
+        if loglevel <= 0 and printlevel <= 0:
+            return
         if data is not None:
-            datahex = data.hex("-")
+            data = bytes(data)  # The encoder buffer is reused for the next frame
+        if self.logwriter is not None:
+            self.logwriter.put(
+                self.logfile, time.time(), comment, data, loglevel, printlevel
+            )
         else:
-            datahex = "(None)"
-        if self.logfile is not None:
-            if loglevel > 0:
-                self.logfile.write(
-                    "{}{:.3f} {} {}\n".format(
-                        time.strftime("%Y-%m-%d %H:%M:"),
-                        time.time() % 60,
-                        comment,
-                        datahex,
-                    )
-                )
-            if loglevel > 1 and data is not None:
-                self.logfile.write(FT12Frame(data).show(dump=True))
-
-        if printlevel > 0:
-            print("{} {}".format(comment, datahex))
-        if printlevel > 1 and data is not None:
-            print(FT12Frame(data).show(dump=True))
-        if printlevel > 2 and data is not None:
-            print(FT12Frame(data).command())
-
-    def req_processor(self, request: bytes) -> Optional[bytes]:
-        frame = FT12Frame(request)
+            ieclog.write_record(
+                self.logfile, time.time(), comment, data, loglevel, printlevel
+            )
+
+    def req_processor(self, request: bytes) -> Optional[bytes | memoryview]:
+        frame = ft12.decode(request)
+        # Corrupted frame or single character from the master
+        if frame is None or frame.start in (ft12.ACK, ft12.NACK):
+            return None
+        if self.scapy:
+            try:  # Valid frames only, scapy can't reject others
+                frame = FT12Frame(request)
+                if frame.start == ft12.START_VARIABLE:
+                    frame.LinkUserData.type  # Raw payload if the ASDU wasn't dissected
+            except Exception:  # Frame scapy can't dissect, discarded
+                return None
         response = None
         match self.state:
             case -1:
                 response = self._when_not_reset(frame)
             case 0:
                 response = self._when_is_reset(frame)
-        if response is not None:
-            return self.fcs_calc2(response).build()
-        else:
+        return response
+
+    def frame_proc(self, request: bytes) -> Optional[bytes | memoryview]:
+        resp = self.req_processor(request)
+        if resp is None:
             return None
 
+        # Frame corrupting if enabled
+        if self.postprocessing is not None:
+            resp = self.postprocessing(resp)
+
+        # Logging of transmitted frame if enabled
+        self.logging("Sent    ", resp, self.loglvl, self.printlvl, ieclog.SENT)
+        return resp
+
     async def conn_handle_async(
         self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     ) -> None:
@@ -435,17 +1087,13 @@ class Server101:
                     # Logging of recieved frame if enabled
                     self.logging("Received", req, self.loglvl, self.printlvl)
 
-                    resp = self.req_processor(req)
-                    if resp is not None:
-
-                        # Frame corrupting if enabled
-                        if self.postprocessing is not None:
-                            resp = self.postprocessing(resp)
-
-                        # Logging of transmitted frame if enabled
-                        self.logging("Sent    ", resp, self.loglvl, self.printlvl)
+                    for request in self.framer.feed(req):
+                        resp = self.frame_proc(request)
                         if resp is not None:
                             writer.write(resp)  # Sending
+                            if writer.transport.get_write_buffer_size() > 0:
+                                # Unsent view is kept by the transport
+                                self.encoder.detach()
                             await writer.drain()
 
                 else:  # Connection has been closed
@@ -466,19 +1114,77 @@ class Server101:
                         # Logging of recieved frame if enabled
                         self.logging("Received", req, self.loglvl, self.printlvl)
 
-                        resp = self.req_processor(req)
-                        if resp is not None:
-
-                            # Frame corrupting if enabled
-                            if self.postprocessing is not None:
-                                resp = self.postprocessing(resp)
+                        for request in self.framer.feed(req):
+                            resp = self.frame_proc(request)
                             if resp is not None:
                                 conn.sendall(resp)  # Sending
-
-                            # Logging of transmitted frame if enabled
-                            self.logging("Sent    ", resp, self.loglvl, self.printlvl)
                     else:  # Connection has been closed
                         self.channel_unreset()
                         break
             except ConnectionResetError:
                 self.channel_unreset()
+
+
+class Protocol101(asyncio.Protocol):
+    """
+    asyncio.Protocol transport for Server101.
+    Received data goes straight to the framer and the state machine,
+    responses to all frames of one read are sent with a single write.
+    accept() creates a server for a new connection (None rejects it),
+    release() is called with that server when the connection is lost.
+    """
+
+    def __init__(
+        self,
+        accept: typing.Callable[[], Optional[Server101]],
+        release: Optional[typing.Callable[[Server101], None]] = None,
+        high_water: int = 64 * 1024,
+    ):
+        self.accept = accept
+        self.release = release
+        self.high_water = high_water
+        self.srv: Optional[Server101] = None
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = typing.cast(asyncio.Transport, transport)
+        self.srv = self.accept()
+        if self.srv is None:
+            print("Connection was rejected")
+            self.transport.close()
+            return
+        # Backpressure only when the master doesn't read its responses
+        self.transport.set_write_buffer_limits(high=self.high_water)
+
+    def data_received(self, data: bytes) -> None:
+        srv = self.srv
+        if srv is None:
+            return
+        # Logging of recieved frame if enabled
+        srv.logging("Received", data, srv.loglvl, srv.printlvl)
+
+        out = bytearray()
+        for request in srv.framer.feed(data):
+            resp = srv.frame_proc(request)
+            if resp is not None:
+                out += resp  # Copied before the encoder buffer is reused
+        if len(out) > 0:
+            self.transport.write(out)  # Sending
+
+    def pause_writing(self) -> None:
+        self.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        self.transport.resume_reading()
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        if self.srv is None:
+            return
+        if exc is None:
+            print("Connection has been closed")
+        else:
+            print("Connection was reset", exc)
+        self.srv.channel_unreset()
+        if self.release is not None:
+            self.release(self.srv)
+        self.srv = None
@@ -0,0 +1,362 @@
+"""
+Frame logging
+
+Server101 hands every frame to write_record() directly, or through a
+LogWriter: records are queued as raw bytes with a timestamp and written
+by a background thread in batches, so polls never wait for the disk or
+the console. Records are formatted, and dissected with scapy at log or
+print level 2 and higher, by a worker process or by the writer thread;
+dissection can also be left until the log is viewed with
+"python3 ieclog.py --dissect".
+
+Frames can also be captured in a compact binary format: CAPTURE_HEAD
+(signature, wall clock and monotonic clock at the start, in ns) followed
+by CAPTURE_RECORD headers (monotonic time in ns, direction, length), each
+followed by the frame. Running this module converts a capture to the
+text log format.
+"""
+
+import concurrent.futures
+import io
+import os
+import struct
+import sys
+import threading
+import time
+from typing import BinaryIO, Iterator, Optional, TextIO
+
+try:  # scapy is only needed for frame dissection
+    import iec101
+    from iec101 import FT12Frame
+except ImportError:
+    iec101 = None
+
+
+CAPTURE_MAGIC = b"FT12CAP\x01"
+CAPTURE_HEAD = struct.Struct("<8sqq")  # signature, wall clock ns, monotonic ns
+CAPTURE_RECORD = struct.Struct("<QBH")  # monotonic ns, direction, frame length
+
+# Frame directions
+RECEIVED = 0
+SENT = 1
+COMMENTS = {RECEIVED: "Received", SENT: "Sent    "}
+
+# Minute of the last formatted record and its date and time text,
+# strftime runs once a minute instead of once a record
+_minute: tuple[float, str] = (-1.0, "")
+
+
+def format_record(stamp: float, comment: str, data: Optional[bytes]) -> str:
+    global _minute
+    minute = stamp // 60
+    if _minute[0] != minute:
+        _minute = (minute, time.strftime("%Y-%m-%d %H:%M:", time.localtime(stamp)))
+    return "{}{:.3f} {} {}\n".format(
+        _minute[1],
+        stamp % 60,
+        comment,
+        data.hex("-") if data is not None else "(None)",
+    )
+
+
+def dissect(data: bytes) -> tuple[str, str]:
+    # Scapy dissection and command of a frame; runs in worker processes too.
+    # Corrupted frames may crash scapy, this must not stop the log writer.
+    try:
+        frame = FT12Frame(data)
+        return frame.show(dump=True), frame.command()
+    except Exception as e:
+        return "Dissection failed: {!r}\n".format(e), ""
+
+
+def watch_parent(parent: int) -> None:
+    # Worker process initializer: exits when the server process is gone,
+    # e.g. killed before it could shut the worker down
+    def watch() -> None:
+        while os.getppid() == parent:
+            time.sleep(1.0)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def write_record(
+    logfile: Optional[TextIO],
+    stamp: float,
+    comment: str,
+    data: Optional[bytes],
+    loglevel: int,
+    printlevel: int,
+    out: TextIO = sys.stdout,
+    dissection: Optional[tuple[str, str]] = None,
+) -> None:
+    # Frames are dissected here unless the dissection is given
+    if (
+        dissection is None
+        and (loglevel > 1 or printlevel > 1)
+        and data is not None
+        and iec101 is not None
+    ):
+        dissection = dissect(data)
+
+    if logfile is not None:
+        if loglevel > 0:
+            logfile.write(format_record(stamp, comment, data))
+        if loglevel > 1 and dissection is not None:
+            logfile.write(dissection[0])
+
+    if printlevel > 0:
+        out.write(
+            "{} {}\n".format(comment, data.hex("-") if data is not None else "(None)")
+        )
+    if printlevel > 1 and dissection is not None:
+        out.write(dissection[0] + "\n")
+    if printlevel > 2 and dissection is not None:
+        out.write(dissection[1] + "\n")
+
+
+def format_records(
+    records: list[tuple[int, Optional[float], str, Optional[bytes], int, int]],
+) -> tuple[list[tuple[int, Optional[str]]], str, int]:
+    # Formats LogWriter records; runs in the worker process. Returns the log
+    # text as (file, text) segments in the order of the records, text None
+    # for a close() request, the console text and the number of records.
+    segments: list[tuple[int, Optional[str]]] = []
+    log = io.StringIO()
+    out = io.StringIO()
+    current = -1
+    count = 0
+    for file, stamp, comment, data, loglevel, printlevel in records:
+        if file != current or stamp is None:
+            if log.tell() > 0:
+                segments.append((current, log.getvalue()))
+                log = io.StringIO()
+            current = file
+            if stamp is None:
+                segments.append((file, None))
+                continue
+        write_record(log, stamp, comment, data, loglevel, printlevel, out)
+        count = count + 1
+    if log.tell() > 0:
+        segments.append((current, log.getvalue()))
+    return segments, out.getvalue(), count
+
+
+class LogWriter:
+    # Background writer shared by servers. Files given to put() must be
+    # closed with close() so that they are closed after their last record.
+    # Records carry file numbers instead of files, so that a batch can be
+    # passed to the worker process as it is.
+
+    def __init__(self, interval: float = 0.1, dissect: str = "thread"):
+        # The thread takes the records every interval seconds,
+        # so it doesn't compete with the event loop on every frame
+        self.interval = interval
+        # Formatting and dissection: "process" - worker process, "thread" -
+        # writer thread, "lazy" - formatting in the writer thread, frames are
+        # dissected only when the log is viewed. Formatting in the thread holds
+        # the GIL for milliseconds per batch and delays the event loop. The
+        # worker is started by the first batch with a level 2 record, records
+        # of levels 0 and 1 are only formatted and stay in the thread.
+        self.dissect = dissect
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.records: list = []  # Taken by the thread as a whole
+        self.files: dict[TextIO, int] = {}  # Numbers of the files given to put()
+        self.logfiles: dict[int, TextIO] = {}  # Files by number, until closed
+        self.next_file = 0
+        self.stopping = False
+        self.written = 0  # Number of records written
+        self.thread = threading.Thread(target=self.run, name="LogWriter", daemon=True)
+        self.thread.start()
+
+    def put(
+        self,
+        logfile: Optional[TextIO],
+        stamp: float,
+        comment: str,
+        data: Optional[bytes],
+        loglevel: int,
+        printlevel: int,
+    ) -> None:
+        # data must not change after the call: pass bytes, not a view
+        if logfile is None:
+            file = -1
+            loglevel = 0
+        else:
+            file = self.files.get(logfile, -1)
+            if file < 0:
+                file = self.files[logfile] = self.next_file
+                self.logfiles[file] = logfile
+                self.next_file = self.next_file + 1
+        self.records.append((file, stamp, comment, data, loglevel, printlevel))
+
+    def close(self, logfile: TextIO) -> None:
+        file = self.files.pop(logfile, None)
+        if file is None:
+            logfile.close()  # No records
+        else:
+            self.records.append((file, None, "", None, 0, 0))
+
+    def stop(self) -> None:
+        # Writes the queued records and stops the thread
+        self.stopping = True
+        self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def write_text(self, segments: list[tuple[int, Optional[str]]], out: str) -> None:
+        touched: set[TextIO] = set()
+        for file, text in segments:
+            if file < 0:
+                continue  # Console only
+            logfile = self.logfiles[file]
+            if text is None:  # close() request
+                del self.logfiles[file]
+                touched.discard(logfile)
+                logfile.close()
+            else:
+                logfile.write(text)
+                touched.add(logfile)
+        for logfile in touched:
+            logfile.flush()
+        if len(out) > 0:
+            sys.stdout.write(out)
+            sys.stdout.flush()
+
+    def run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            stopping = self.stopping  # Before taking the last records
+            records, self.records = self.records, []
+            if len(records) > 0:
+                if self.dissect == "process" and (
+                    self.executor is not None
+                    or any(r[4] > 1 or r[5] > 1 for r in records)
+                ):
+                    if self.executor is None:
+                        self.executor = concurrent.futures.ProcessPoolExecutor(
+                            1, initializer=watch_parent, initargs=(os.getpid(),)
+                        )
+                    future = self.executor.submit(format_records, records)
+                    segments, out, count = future.result()
+                else:
+                    if self.dissect == "lazy":
+                        records = [
+                            (
+                                file,
+                                stamp,
+                                comment,
+                                data,
+                                min(loglevel, 1),
+                                min(printlevel, 1),
+                            )
+                            for file, stamp, comment, data, loglevel, printlevel in records
+                        ]
+                    segments, out, count = format_records(records)
+                self.write_text(segments, out)
+                self.written = self.written + count
+            if stopping:
+                return
+
+
+class CaptureWriter:
+    # Buffered binary capture appender, flushed every flush_interval s by a
+    # background thread, so frames reach the file on an idle link too
+
+    def __init__(
+        self, filename: str, buffering: int = 1 << 16, flush_interval: float = 1.0
+    ):
+        self.file: BinaryIO = open(filename, "wb", buffering=buffering)
+        self.file.write(
+            CAPTURE_HEAD.pack(CAPTURE_MAGIC, time.time_ns(), time.monotonic_ns())
+        )
+        self.flush_interval = flush_interval
+        self.count = 0  # Number of captured frames
+        self.closing = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="CaptureWriter", daemon=True
+        )
+        self.thread.start()
+
+    def write(self, direction: int, data: bytes | memoryview) -> None:
+        self.file.write(CAPTURE_RECORD.pack(time.monotonic_ns(), direction, len(data)))
+        self.file.write(data)
+        self.count = self.count + 1
+
+    def run(self) -> None:
+        while not self.closing.wait(self.flush_interval):
+            self.file.flush()
+
+    def close(self) -> None:
+        self.closing.set()
+        self.thread.join()
+        self.file.close()
+
+
+def read_capture(filename: str) -> Iterator[tuple[float, int, bytes]]:
+    # Yields (wall clock time, direction, frame) for every captured frame
+    with open(filename, "rb") as f:
+        head = f.read(CAPTURE_HEAD.size)
+        if len(head) < CAPTURE_HEAD.size or head[:8] != CAPTURE_MAGIC:
+            raise ValueError("{} is not a capture file".format(filename))
+        _, wall_ns, mono_ns = CAPTURE_HEAD.unpack(head)
+        while True:
+            header = f.read(CAPTURE_RECORD.size)
+            if len(header) < CAPTURE_RECORD.size:
+                return  # End of file or a truncated record
+            stamp_ns, direction, length = CAPTURE_RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield (wall_ns + stamp_ns - mono_ns) / 1e9, direction, data
+
+
+def read_log(filename: str) -> Iterator[tuple[str, bytes]]:
+    # Yields (log line, frame) for every frame line of a text log
+    with open(filename) as f:
+        for line in f:
+            words = line.split()
+            if len(words) >= 4 and words[2] in ("Received", "Sent"):
+                try:
+                    yield line, bytes.fromhex(words[-1].replace("-", ""))
+                except ValueError:
+                    pass
+
+
+def convert_capture(filename: str, out: TextIO, dissected: bool = False) -> int:
+    # Writes a capture (or a text log) in the text log format, dissecting
+    # frames when asked. Returns the number of frames.
+    with open(filename, "rb") as f:
+        capture = f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+    if capture:
+        lines: Iterator[tuple[str, bytes]] = (
+            (format_record(stamp, COMMENTS.get(direction, "Unknown "), data), data)
+            for stamp, direction, data in read_capture(filename)
+        )
+    else:
+        lines = read_log(filename)
+    count = 0
+    for line, data in lines:
+        out.write(line)
+        if dissected:
+            out.write(dissect(data)[0])
+        count = count + 1
+    return count
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    dissected = "--dissect" in args
+    if dissected:
+        args.remove("--dissect")
+        if iec101 is None:
+            print("--dissect requires iec101 and scapy")
+            sys.exit(1)
+    if len(args) not in (1, 2):
+        print("usage: python3 ieclog.py [--dissect] capture.cap|iec101.log [out.log]")
+        sys.exit(1)
+    if len(args) == 2:
+        with open(args[1], "w") as out:
+            convert_capture(args[0], out, dissected)
+    else:
+        convert_capture(args[0], sys.stdout, dissected)
@@ -0,0 +1,136 @@
+"""
+Telemetry replay from recorded files
+
+Records (time, IOA, value, flags) are streamed from CSV or from a compact
+binary file mapped with mmap, so files of any size are replayed without
+loading them. Replayer applies them to the points at the recorded pace,
+N times faster, or as fast as possible.
+
+Binary format: MAGIC followed by RECORD structs, little-endian.
+"""
+
+import asyncio
+import csv
+import mmap
+import struct
+import sys
+import time
+from typing import Iterator, Optional
+
+from iec101srv import Point
+
+MAGIC = b"IECR\x01\x00\x00\x00"  # File signature and format version
+RECORD = struct.Struct("<dIdh")  # time, IOA, value, flags
+
+Record = tuple[float, int, float, int]
+
+
+def read_csv(filename: str) -> Iterator[Record]:
+    # Rows: time,ioa,value,flags; a header row and empty flags are allowed
+    with open(filename, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or not row[1].strip().isdigit():
+                continue  # Header or empty line
+            flags = row[3].strip() if len(row) > 3 else ""
+            yield float(row[0]), int(row[1]), float(row[2]), int(flags or 0)
+
+
+def read_binary(filename: str) -> Iterator[Record]:
+    with open(filename, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a replay file".format(filename))
+        size = f.seek(0, 2)
+        if size == len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = size - (size - len(MAGIC)) % RECORD.size  # Ignore a partial tail
+            view = memoryview(mm)[len(MAGIC) : end]
+            try:
+                yield from RECORD.iter_unpack(view)
+            finally:
+                view.release()
+
+
+def read_records(filename: str) -> Iterator[Record]:
+    # Format is chosen by the file signature
+    with open(filename, "rb") as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    return read_binary(filename) if binary else read_csv(filename)
+
+
+def write_binary(filename: str, records: Iterator[Record]) -> int:
+    # Returns the number of records written
+    count = 0
+    with open(filename, "wb") as f:
+        f.write(MAGIC)
+        for record in records:
+            f.write(RECORD.pack(*record))
+            count = count + 1
+    return count
+
+
+class Replayer:
+    # speed: 1.0 - recorded pace, N - N times faster, 0 - as fast as possible
+
+    def __init__(
+        self,
+        points: dict[int, Point],
+        records: Iterator[Record],
+        speed: float = 1.0,
+        time_offset: Optional[float] = None,
+        batch: int = 1000,
+    ):
+        self.points = points  # Points by IOA
+        self.records = records
+        self.speed = speed
+        # Added to the recorded timestamps, None - timestamps are taken at replay
+        self.time_offset = time_offset
+        self.batch = batch  # Records applied between yields to the event loop
+        self.count = 0  # Records applied
+        self.skipped = 0  # Records of unknown IOAs
+        self.elapsed = 0.0
+
+    def rate(self) -> float:
+        # Records per second
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    async def run(self) -> None:
+        points = self.points
+        start = time.perf_counter()
+        first: Optional[float] = None
+        pending = 0
+        for rec_time, ioa, value, flags in self.records:
+            if first is None:
+                first = rec_time
+            if self.speed > 0:
+                delay = start + (rec_time - first) / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    pending = 0
+            pt = points.get(ioa)
+            if pt is None:
+                self.skipped = self.skipped + 1
+            else:
+                pt.set(
+                    value,
+                    flags,
+                    (
+                        time.time()
+                        if self.time_offset is None
+                        else rec_time + self.time_offset
+                    ),
+                )
+                self.count = self.count + 1
+            pending = pending + 1
+            if pending >= self.batch:
+                await asyncio.sleep(0)
+                pending = 0
+        self.elapsed = time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    # Converts a CSV recording to the binary format
+    if len(sys.argv) != 3:
+        print("usage: python3 iecreplay.py records.csv records.bin")
+        sys.exit(1)
+    print(write_binary(sys.argv[2], read_csv(sys.argv[1])), "records written")
@@ -0,0 +1,192 @@
+"""
+Point table in shared memory
+
+SharedPointTable keeps the PointTable columns in a multiprocessing
+shared memory block, so one writer process (generator or ingest) can
+feed server processes without pickling or pipes.
+
+Single writer, many readers. Every row has a sequence counter (seqlock):
+the writer makes it odd before changing the row and even afterwards, and
+readers retry until they read the row with the same even counter before
+and after. Changed rows are also written to a ring of row indexes, which
+readers follow with their own cursors to turn changes into events.
+The seqlock relies on stores becoming visible in program order (x86-64).
+
+Block layout: MAGIC, HEADER, then the columns, each 8-byte aligned.
+"""
+
+import array
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Optional
+
+from iec101srv import NAN, PointTable
+
+MAGIC = b"IECSHM\x01\x00"
+HEADER = 4  # capacity, rows, ring size, changes (written ring entries), 8 bytes each
+
+# Columns: name, format, length ("rows" or "ring")
+_COLUMNS = (
+    ("seq", "Q", "rows"),
+    ("value", "d", "rows"),
+    ("time", "d", "rows"),
+    ("io_address", "I", "rows"),
+    ("flags", "h", "rows"),
+    ("type", "B", "rows"),
+    ("group", "B", "rows"),
+    ("dirty", "B", "rows"),
+    ("ring", "I", "ring"),
+)
+
+
+def _layout(capacity: int, ring: int) -> tuple[dict[str, tuple[int, int]], int]:
+    # Column offsets and sizes, total block size
+    offset = len(MAGIC) + HEADER * 8
+    columns = {}
+    for name, fmt, length in _COLUMNS:
+        size = array.array(fmt).itemsize * (capacity if length == "rows" else ring)
+        columns[name] = (offset, size)
+        offset = offset + (size + 7) // 8 * 8
+    return columns, offset
+
+
+class SharedPointTable(PointTable):
+    # Created by the writer (create=True), attached by name by the readers.
+    # The number of rows is limited by the capacity given at creation.
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        capacity: int = 0,
+        ring: int = 65536,
+        create: bool = False,
+        untrack: bool = False,
+    ):
+        # untrack: set in readers that are not started by the creator with
+        # multiprocessing, otherwise their resource tracker removes the block
+        self.logs = {}
+        self.pointsets = []
+        if create:
+            _, size = _layout(capacity, ring)
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+            self.shm.buf[: len(MAGIC)] = MAGIC
+        else:
+            self.shm = shared_memory.SharedMemory(name)
+            if untrack:
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            if bytes(self.shm.buf[: len(MAGIC)]) != MAGIC:
+                raise ValueError("{} is not a shared point table".format(name))
+        self.name = self.shm.name
+        self.header = self.shm.buf[len(MAGIC) : len(MAGIC) + HEADER * 8].cast("Q")
+        if create:
+            self.header[0] = capacity
+            self.header[2] = ring
+        columns, _ = _layout(self.header[0], self.header[2])
+        for (name, fmt, _), (offset, size) in zip(_COLUMNS, columns.values()):
+            setattr(self, name, self.shm.buf[offset : offset + size].cast(fmt))
+        self.cursor = self.header[3]  # Next ring entry to read (readers)
+        self.lost = 0  # Changes missed by this reader because of ring overruns
+
+    def __len__(self) -> int:
+        return self.header[1]
+
+    def add(
+        self,
+        type: int,
+        io_address: int,
+        value: Any = None,
+        flags: Optional[int] = None,
+        time: Optional[float] = None,
+        group: int = 0,
+    ) -> int:
+        # Writer only: rows become visible to readers once they are complete
+        index = self.header[1]
+        if index >= self.header[0]:
+            raise ValueError("Shared point table is full")
+        self.type[index] = type
+        self.io_address[index] = io_address
+        self.value[index] = NAN if value is None else value
+        self.flags[index] = -1 if flags is None else flags
+        self.time[index] = NAN if time is None else time
+        self.group[index] = group
+        self.header[1] = index + 1
+        return index
+
+    def set(
+        self,
+        index: int,
+        value: Any = None,
+        flags: Optional[int] = None,
+        time: Optional[float] = None,
+    ) -> None:
+        # Writer only
+        seq = self.seq
+        seq[index] = seq[index] + 1  # Odd: the row is being written
+        super().set(index, value, flags, time)
+        seq[index] = seq[index] + 1
+        self.publish(index)
+
+    def publish(self, index: int) -> None:
+        # Announces a changed row to the readers
+        changes = self.header[3]
+        self.ring[changes % self.header[2]] = index
+        self.header[3] = changes + 1
+
+    def record(self, indexes) -> None:
+        # Writer only: rows written directly to the columns are announced too.
+        # Such writes must be enclosed in seq increments, as VectorGenerator does.
+        indexes = list(indexes)
+        for index in indexes:
+            self.publish(index)
+        super().record(indexes)
+
+    def read(self, index: int) -> tuple[Any, Optional[int], Optional[float]]:
+        seq = self.seq
+        while True:
+            before = seq[index]
+            if before & 1 == 0:
+                row = super().read(index)
+                if seq[index] == before:
+                    return row
+            time.sleep(0)  # The writer is changing the row
+
+    def changes(self) -> list[int]:
+        # Reader: rows changed since the previous call. If the writer has
+        # overrun the ring, the missed changes are counted in lost.
+        changes = self.header[3]
+        ring_size = self.header[2]
+        if changes - self.cursor > ring_size:
+            self.lost = self.lost + changes - ring_size - self.cursor
+            self.cursor = changes - ring_size
+        indexes = [self.ring[i % ring_size] for i in range(self.cursor, changes)]
+        if self.header[3] - self.cursor > ring_size:
+            # Overrun while reading: the oldest entries may have been replaced
+            self.lost = self.lost + len(indexes)
+            indexes = []
+        self.cursor = changes
+        return indexes
+
+    def poll(self) -> int:
+        # Reader: records the changed rows in the change logs of this process.
+        # Readers never write to the block, the dirty flags belong to the writer.
+        indexes = self.changes()
+        self.notify(indexes)
+        return len(indexes)
+
+    def snapshot(self) -> dict[str, array.array]:
+        rows = len(self)
+        return {
+            name: array.array(getattr(self, name).format, getattr(self, name)[:rows])
+            for name in ("io_address", "value", "flags", "time")
+        }
+
+    def close(self) -> None:
+        # Views of the block must be released before it can be closed
+        for name, _, _ in _COLUMNS:
+            getattr(self, name).release()
+        self.header.release()
+        self.shm.close()
+
+    def unlink(self) -> None:
+        # Creator only: removes the block once all processes have closed it
+        self.shm.unlink()
@@ -0,0 +1,183 @@
+"""
+Process simulation helpers
+
+Scheduler wakes only when the earliest point update is due, so the cost
+of a simulation step depends on the number of due points, not on the
+size of the point set. VectorGenerator updates all due points of a
+PointTable with a few NumPy operations (numpy is optional).
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Callable, Optional
+
+import iectypes
+from iec101srv import Point, PointTable
+
+try:  # numpy is only needed for VectorGenerator
+    import numpy as np
+except ImportError:
+    np = None
+
+# Types updated as toggling discrete signals, the others as measurements
+DISCRETE_TYPES = (
+    iectypes.Type.M_SP_NA_1,
+    iectypes.Type.M_SP_TA_1,
+    iectypes.Type.M_SP_TB_1,
+)
+
+
+class RateClass:
+    # Update period of a point is chosen randomly between min_period and max_period
+
+    def __init__(self, min_period: float, max_period: float):
+        self.min_period = min_period
+        self.max_period = max_period
+
+    def next_period(self) -> float:
+        return random.uniform(self.min_period, self.max_period)
+
+
+class Scheduler:
+    # Heap of (due time, sequence, point, rate class) entries
+
+    def __init__(
+        self,
+        update: Callable[[Point], None],
+        rates: Optional[dict[int, RateClass]] = None,
+        default: Optional[RateClass] = None,
+    ):
+        self.update = update  # Called for every point when its update is due
+        self.rates = rates if rates is not None else {}  # Rate classes by group
+        self.default = default if default is not None else RateClass(5, 300)
+        self.heap: list[tuple[float, int, Point, RateClass]] = []
+        self.seq = itertools.count()  # Keeps heap order stable for equal due times
+        self.changed = asyncio.Event()  # Set when the earliest due time may change
+        self.updates = 0  # Number of updates done
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def rate(self, pt: Point) -> RateClass:
+        return self.rates.get(pt.group, self.default)
+
+    def add(
+        self, pt: Point, due: Optional[float] = None, rate: Optional[RateClass] = None
+    ) -> None:
+        # The first update is due immediately unless the due time is given
+        heapq.heappush(
+            self.heap,
+            (
+                time.time() if due is None else due,
+                next(self.seq),
+                pt,
+                self.rate(pt) if rate is None else rate,
+            ),
+        )
+        self.changed.set()
+
+    def add_points(self, pts: list[Point]) -> None:
+        now = time.time()
+        for pt in pts:
+            self.heap.append((now, next(self.seq), pt, self.rate(pt)))
+        heapq.heapify(self.heap)
+        self.changed.set()
+
+    def run_due(self, now: float) -> int:
+        # Updates every due point and schedules its next update
+        heap = self.heap
+        count = 0
+        while len(heap) > 0 and heap[0][0] <= now:
+            _, _, pt, rate = heap[0]
+            self.update(pt)
+            heapq.heapreplace(
+                heap, (now + rate.next_period(), next(self.seq), pt, rate)
+            )
+            count = count + 1
+        self.updates = self.updates + count
+        return count
+
+    async def run(self) -> None:
+        while True:
+            self.changed.clear()
+            self.run_due(time.time())
+            timeout = self.heap[0][0] - time.time() if len(self.heap) > 0 else None
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+class VectorGenerator:
+    # Measurements follow an AR(1) random walk: value * decay + N(0, sigma),
+    # discrete signals toggle. Due rows are found, updated and written to the
+    # table columns in bulk, then recorded in the change logs.
+
+    def __init__(
+        self,
+        table: PointTable,
+        rate: RateClass,
+        sigma: float = 0.10,
+        decay: float = 0.99,
+        time_offset: float = 0.0,
+        indexes: Optional[list[int]] = None,
+    ):
+        if np is None:
+            raise ImportError("VectorGenerator requires numpy")
+        self.table = table
+        self.rate = rate
+        self.sigma = sigma
+        self.decay = decay
+        self.time_offset = time_offset  # Added to the timestamps (time zone)
+        # Table rows driven by this generator; an empty list must give
+        # integer indexes too, np.asarray([]) is a float array
+        self.rows = np.asarray(
+            range(len(table)) if indexes is None else indexes, dtype=np.intp
+        )
+        types = np.frombuffer(table.type, dtype=np.uint8)[self.rows]
+        self.discrete = np.isin(types, DISCRETE_TYPES)
+        self.due = np.full(len(self.rows), time.time())  # Next update of every row
+        self.rng = np.random.default_rng()
+        self.updates = 0  # Number of updates done
+
+    def step(self, now: float) -> int:
+        # Updates every due row and schedules its next update
+        due = np.flatnonzero(self.due <= now)
+        if len(due) == 0:
+            return 0
+        rows = self.rows[due]
+        discrete = self.discrete[due]
+        # Views of the table columns; they must not outlive this call,
+        # the arrays can't be resized while a view exists
+        seq = getattr(self.table, "seq", None)  # Seqlock of a shared table
+        if seq is not None:
+            seq = np.frombuffer(seq, dtype=np.uint64)
+            seq[rows] += 1  # Odd: the rows are being written
+        values = np.frombuffer(self.table.value, dtype=np.float64)
+        old = np.nan_to_num(values[rows])
+        values[rows] = np.where(
+            discrete,
+            1.0 - (old != 0),
+            old * self.decay + self.rng.normal(0.0, self.sigma, len(rows)),
+        )
+        np.frombuffer(self.table.flags, dtype=np.int16)[rows] = 0
+        np.frombuffer(self.table.time, dtype=np.float64)[rows] = now + self.time_offset
+        if seq is not None:
+            seq[rows] += 1
+        del values, seq
+        self.due[due] = now + self.rng.uniform(
+            self.rate.min_period, self.rate.max_period, len(due)
+        )
+        self.table.record(rows.tolist())
+        self.updates = self.updates + len(due)
+        return len(due)
+
+    async def run(self) -> None:
+        while True:
+            self.step(time.time())
+            if len(self.due) == 0:
+                return
+            await asyncio.sleep(max(float(self.due.min()) - time.time(), 0.0))
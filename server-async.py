@@ -1,24 +1,62 @@
 import asyncio
 import iectypes
+import multiprocessing
+import multiprocessing.connection
 import random
+import signal
 import sys
 import socket
 import time
 from os import path
 from os import mkdir
 
-from iec101srv import Point, Server101
+from typing import Optional
+
+from iec101srv import (
+    ChangeLog,
+    Overflow,
+    Point,
+    PointSet,
+    PointTable,
+    Protocol101,
+    Server101,
+)
+from ieclog import CaptureWriter, LogWriter
+from iecreplay import Replayer, read_records
+from iecshm import SharedPointTable
+from iecsim import RateClass, Scheduler, VectorGenerator
 
 # IEC101 server settings
 HOST = "127.0.0.1"  # Client address (empty means "any address")
 PORT = 4001  # Port to listen on (non-privileged ports are > 1023)
 ASDU_ADDR = 1
 BACKGROUND = True
-MAX_CONNECTIONS = 3
+MAX_CONNECTIONS = 3  # Per worker process
+# Worker processes sharing the listening port (SO_REUSEPORT), 1 - single process
+WORKERS = 1
+RESTART_DELAY = 1.0  # Seconds before a worker that has exited is restarted
+# With WORKERS > 1: points are kept in shared memory and updated by one generator
+# process, otherwise every worker runs its own generator
+SHARED_POINTS = True
+SHM_RING = 65536  # Changes kept for the workers, older ones are recovered by GI
+SHM_POLL = 0.05  # Seconds between checks for changes in the workers
+SCAPY_DECODER = False  # Decode requests with scapy instead of the ft12 codec
+TRANSPORT = "protocol"  # "protocol" (asyncio.Protocol) or "stream" (StreamReader)
+
+# Class 1 event queue settings (per connection)
+EVQUEUE_SIZE = 10000
+EVQUEUE_OVERFLOW = Overflow.DROP_OLDEST  # DROP_OLDEST, DROP_NEWEST or INROGEN
+EVQUEUE_COALESCE = False  # Newer value replaces the unsent one of the same IOA
+CHANGELOG_SIZE = 100000  # Point changes kept for all connections
 
 # Logging settings (Higher level -> more messages)
 LOGLEVEL = 1
 PRINTLEVEL = 1
+LOGQUEUE = True  # Write logs from a background thread
+# Scapy dissection at level 2 and higher with LOGQUEUE: "process" - worker
+# process, "thread" - log writer thread, "lazy" - when viewed (python3 ieclog.py --dissect)
+DISSECT = "thread"
+CAPTURE = False  # Capture frames to logs/*.cap (convert with "python3 ieclog.py")
 
 # ASDU settings
 DEF_TIMEZONE = 3 * 3600
@@ -26,15 +64,29 @@ DEF_TIMEZONE = 3 * 3600
 #Discrete signals
 DEF_DISCRSTART = 1
 DEF_DISCRCOUNT = 48
+DEF_DISCRGROUP = 1  # Interrogation group (QOI 21..36 -> group 1..16), 0 - none
 
 #Analog signals
 DEF_MEASSTART = 1001
 DEF_MEASCOUNT = 32
+DEF_MEASGROUP = 2
 
 # Signal update time sets randomly between DEF_MINUPDATE and DEF_MAXUPDATE
 DEF_MINUPDATE = 5
 DEF_MAXUPDATE = 300
+# Update rate classes by interrogation group: (min, max) update time
+DEF_RATES = {
+    DEF_DISCRGROUP: (DEF_MINUPDATE, DEF_MAXUPDATE),
+    DEF_MEASGROUP: (DEF_MINUPDATE, DEF_MAXUPDATE),
+}
 # DEF_MAXUPDATE = max(DEF_DISCRCOUNT,DEF_MEASCOUNT)/3 
+# "scheduler" updates points one by one, "numpy" updates all due points at once,
+# "replay" applies the changes recorded in REPLAY_FILE
+GENERATOR = "scheduler"
+REPLAY_FILE = "records.csv"  # CSV (time,ioa,value,flags) or iecreplay binary file
+REPLAY_SPEED = 1.0  # 1.0 - recorded pace, N - N times faster, 0 - as fast as possible
+DEF_SIGMA = 0.10  # Measurement random walk: value * DEF_DECAY + N(0, DEF_SIGMA)
+DEF_DECAY = 0.99
 
 # Data corruption settings
 # Don't parse FT12 frames when grinder is enabled otherwise scapy may crash! (loglevel and printlevel should be < 2)
@@ -79,45 +131,31 @@ def grinder(data: bytes, logging: bool = MIRRORLOG) -> bytes:
 
 
 class Point_sc(Point):
+    __slots__ = ()  # Views of PointTable rows, without a __dict__
 
-    def check(self) -> None:
+    def update(self) -> None:
         pass
 
 
 class Meas(Point_sc):
     # M_ME_
+    __slots__ = ()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.nexttime = time.time()
-
-    def check(self) -> None:
-        def measuregen(oldvalue: float):
-            if oldvalue:
-                return oldvalue * 0.99 + random.gauss(mu=0.0, sigma=0.10)
-            else:
-                return random.gauss(mu=0.0, sigma=0.10)
-
-        if self.nexttime < time.time():
-            self.set(
-                value=measuregen(self.value), flags=0, time=time.time() + DEF_TIMEZONE
-            )
-            self.nexttime = time.time() + random.uniform(DEF_MINUPDATE, DEF_MAXUPDATE)
+    def update(self) -> None:
+        oldvalue = self.value
+        if oldvalue:
+            value = oldvalue * 0.99 + random.gauss(mu=0.0, sigma=0.10)
+        else:
+            value = random.gauss(mu=0.0, sigma=0.10)
+        self.set(value=value, flags=0, time=time.time() + DEF_TIMEZONE)
 
 
 class Discr(Point_sc):
     # M_SP_
+    __slots__ = ()
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.nexttime = time.time()
-
-    def check(self) -> None:
-        if self.nexttime < time.time():
-            self.set(
-                value=random.getrandbits(1), flags=0, time=time.time() + DEF_TIMEZONE
-            )
-            self.nexttime = time.time() + random.uniform(DEF_MINUPDATE, DEF_MAXUPDATE)
+    def update(self) -> None:
+        self.set(value=random.getrandbits(1), flags=0, time=time.time() + DEF_TIMEZONE)
 
 
 def makepath(logname: str, *folders: str) -> str:
@@ -125,22 +163,16 @@ def makepath(logname: str, *folders: str) -> str:
     for f in folders:
         logpath = path.join(logpath, f)
         if not path.exists(logpath):
-            mkdir(logpath)
+            try:
+                mkdir(logpath)
+            except FileExistsError:  # Created by another worker
+                pass
     return path.join(logpath, logname)
 
 
-async def process(set_of_pnts: list[Point_sc]) -> None:
-    while True:
-        # Process imitation
-        for pnt in set_of_pnts:
-            pnt.check()
-        await asyncio.sleep(0.25)
-
-
-async def main():
-
+def make_points(table: PointTable) -> list[Point_sc]:
     # monitoring points preparation - Measurements
-    set_of_points = []
+    set_of_points: list[Point_sc] = []
     for i in range(DEF_MEASCOUNT):
         set_of_points.append(
             Meas(
@@ -148,6 +180,8 @@ async def main():
                 io_address=i + DEF_MEASSTART,
                 value=i,
                 flags=0,
+                group=DEF_MEASGROUP,
+                table=table,
             )
         )
     # monitoring points preparation - Discrete points
@@ -158,55 +192,182 @@ async def main():
                 io_address=i + DEF_DISCRSTART,
                 value=True,
                 flags=0,
+                group=DEF_DISCRGROUP,
+                table=table,
             )
         )
+    return set_of_points
+
+
+def start_generator(
+    table: PointTable, set_of_points: list[Point_sc]
+) -> list[asyncio.Task]:
+    # Starting separate data generating task, it wakes only when updates are due
+    tasks = []
+    match GENERATOR:
+        case "replay":
+            replayer = Replayer(
+                {pnt.io_address: pnt for pnt in set_of_points},
+                read_records(REPLAY_FILE),
+                REPLAY_SPEED,
+            )
+            tasks.append(asyncio.create_task(replayer.run()))
+        case "numpy":
+            # One vectorized generator per rate class
+            for group, rate in DEF_RATES.items():
+                generator = VectorGenerator(
+                    table,
+                    RateClass(*rate),
+                    DEF_SIGMA,
+                    DEF_DECAY,
+                    DEF_TIMEZONE,
+                    [i for i in range(len(table)) if table.group[i] == group],
+                )
+                tasks.append(asyncio.create_task(generator.run()))
+        case _:
+            scheduler = Scheduler(
+                lambda pnt: pnt.update(),
+                {group: RateClass(*rate) for group, rate in DEF_RATES.items()},
+                RateClass(DEF_MINUPDATE, DEF_MAXUPDATE),
+            )
+            scheduler.add_points(set_of_points)
+            tasks.append(asyncio.create_task(scheduler.run()))
+    return tasks
+
+
+async def generate(shared: str) -> None:
+    # Generator process: the only writer of the shared point table
+    table = SharedPointTable(shared)
+    set_of_points = [
+        (Meas if table.type[i] == iectypes.Type.M_ME_NC_1 else Discr).view(table, i)
+        for i in range(len(table))
+    ]
+    await asyncio.gather(*start_generator(table, set_of_points))
 
-        # Starting separate data generating task
-        task1 = asyncio.create_task(process(set_of_points))
+
+async def follow(table: SharedPointTable, servers: list[Server101]) -> None:
+    # Turns the changes made by the generator process into events
+    lost = 0
+    while True:
+        table.poll()
+        if table.lost != lost:  # The ring was overrun, recover by interrogation
+            lost = table.lost
+            for srv101 in servers:
+                srv101.events_lost()
+        await asyncio.sleep(SHM_POLL)
+
+
+async def main(worker: Optional[int] = None, shared: Optional[str] = None):
 
     servers = []  # servers list
+    if shared is None:
+        table = PointTable()  # Point data storage
+        set_of_points = make_points(table)
+        tasks = start_generator(table, set_of_points)
+    else:
+        # Points are written by the generator process
+        table = SharedPointTable(shared)
+        set_of_points = table.views()
+        tasks = [asyncio.create_task(follow(table, servers))]
+
+    pointset = PointSet(set_of_points)  # Shared by all servers
+    # Shared by all servers
+    logwriter = LogWriter(dissect=DISSECT) if LOGQUEUE else None
+    changelog = ChangeLog(CHANGELOG_SIZE)  # Shared by all servers
+
+    def srv_open() -> Optional[Server101]:
+        """
+        Creates new server when new connection is accepted
+        Returns None if the connection should be rejected
+        """
+        if len(servers) >= MAX_CONNECTIONS:
+            return None
+
+        # log file path
+        logname = makepath(
+            "iec101_{}{}.log".format(
+                time.strftime("%y-%m-%d-%H-%M-%S"),
+                "" if worker is None else "_w{}".format(worker),
+            ),
+            "logs",
+        )
+        logfile = open(logname, "a", buffering=-1)
+        capture = CaptureWriter(logname[:-4] + ".cap") if CAPTURE else None
+
+        # Create iec101 server...
+        srv101 = Server101(
+            ASDU_ADDR,
+            BACKGROUND,
+            grinder,
+            logfile,
+            PRINTLEVEL,
+            LOGLEVEL,
+            SCAPY_DECODER,
+            EVQUEUE_SIZE,
+            EVQUEUE_OVERFLOW,
+            EVQUEUE_COALESCE,
+            changelog,
+            logwriter,
+            capture,
+        )
+        servers.append(srv101)
+        logfile.write("Server instance: " + str(srv101) + "\n")
+        print("Server added:", srv101, "Count:", len(servers))
+        # ...and attach it to the points
+        srv101.attach(pointset)
+        return srv101
+
+    def srv_close(srv101: Server101) -> None:
+        # Destroy server when connection is closed
+        srv101.del_all_points()
+        servers.remove(srv101)
+        if logwriter is not None:
+            logwriter.close(srv101.logfile)  # After its queued records
+        else:
+            srv101.logfile.close()
+        if srv101.capture is not None:
+            srv101.capture.close()
+        print(
+            "Server removed: ",
+            srv101,
+            "Count:",
+            len(servers),
+            "Events dropped:",
+            srv101.events.dropped,
+        )
 
     async def conn_accept(
         reader: asyncio.StreamReader, writer: asyncio.StreamWriter
     ) -> None:
         """
         Creating callable connection accept processor
-        Creates new server when new connection is accepted
-        and removes when connection is closed
+        for the stream based transport
         """
-        if len(servers) >= MAX_CONNECTIONS:
+        srv101 = srv_open()
+        if srv101 is None:
             print("Connection was rejected")
             writer.close()
             return
-
-        # log file path
-        logname = makepath(
-            "iec101_{}.log".format(time.strftime("%y-%m-%d-%H-%M-%S")), "logs"
-        )
-
-        with open(logname, "a", buffering=-1) as logfile:
-
-            # Create iec101 server...
-            srv101 = Server101(
-                ASDU_ADDR, BACKGROUND, grinder, logfile, PRINTLEVEL, LOGLEVEL
-            )
-            servers.append(srv101)
-            if logfile is not None:
-                logfile.write("Server instance: " + str(srv101) + "\n")
-            print("Server added:", srv101, "Count:", len(servers))
-            # ...and add points to it
-            for p in set_of_points:
-                srv101.add_point(p)
-
-            # Start iec101 server
+        # Start iec101 server
+        try:
             await srv101.conn_handle_async(reader, writer)
-            # Destroy
-            srv101.del_all_points()
-            servers.remove(srv101)
-            print("Server removed: ", srv101, "Count:", len(servers))
-
-    # Creating TCP socket
-    s = await asyncio.start_server(conn_accept, HOST, PORT)
+        finally:
+            srv_close(srv101)
+
+    # Creating TCP socket, shared by the worker processes
+    reuse_port = worker is not None
+    match TRANSPORT:
+        case "protocol":
+            s = await asyncio.get_running_loop().create_server(
+                lambda: Protocol101(srv_open, srv_close),
+                HOST,
+                PORT,
+                reuse_port=reuse_port,
+            )
+        case _:
+            s = await asyncio.start_server(
+                conn_accept, HOST, PORT, reuse_port=reuse_port
+            )
 
     try:
         async with s:
@@ -215,6 +376,80 @@ async def main():
     except KeyboardInterrupt:
         sys.exit()
 
+    finally:
+        for task in tasks:  # Point updates stop with the server
+            task.cancel()
+        if logwriter is not None:
+            logwriter.stop()  # Writes the queued records
+
+
+def worker_main(worker: int, shared: Optional[str]) -> None:
+    try:
+        if worker < 0:
+            asyncio.run(generate(shared))
+        else:
+            asyncio.run(main(worker, shared))
+    except KeyboardInterrupt:
+        pass
+
+
+def supervise() -> None:
+    """
+    Starts WORKERS processes serving the same port
+    (and the generator process, if the points are shared)
+    and restarts the ones that have exited
+    """
+    workers: dict[int, multiprocessing.Process] = {}  # -1: generator process
+    shared = None
+    if SHARED_POINTS:
+        shared = SharedPointTable(
+            capacity=DEF_MEASCOUNT + DEF_DISCRCOUNT, ring=SHM_RING, create=True
+        )
+        make_points(shared)
+
+    def start(worker: int) -> None:
+        proc = multiprocessing.Process(
+            target=worker_main,
+            args=(worker, None if shared is None else shared.name),
+            name="worker-{}".format(worker) if worker >= 0 else "generator",
+        )
+        proc.start()
+        workers[worker] = proc
+        print("Worker started:", worker, "PID:", proc.pid)
+
+    def stop(signum, frame) -> None:
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)  # Workers are stopped on SIGTERM too
+    if shared is not None:
+        start(-1)
+    for worker in range(WORKERS):
+        start(worker)
+    try:
+        while True:
+            # Sleeps until any worker exits
+            multiprocessing.connection.wait([p.sentinel for p in workers.values()])
+            time.sleep(RESTART_DELAY)
+            for worker, proc in list(workers.items()):
+                if not proc.is_alive():
+                    print("Worker exited:", worker, "Exit code:", proc.exitcode)
+                    start(worker)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in workers.values():
+            proc.terminate()
+        for proc in workers.values():
+            proc.join()
+        if shared is not None:
+            shared.close()
+            shared.unlink()
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            sys.exit("WORKERS > 1 requires SO_REUSEPORT support")
+        supervise()
+    else:
+        asyncio.run(main())